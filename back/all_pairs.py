@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Matrice des durées entre toutes les paires de gares du graphe (best_edges).
+
+Construction : une recherche one-to-all depuis chaque gare, réparties sur un
+pool de processus ; chaque processus écrit ses lignes directement dans deux
+fichiers .npy ouverts en memory-map :
+  dist.npy : durée en secondes (uint32, UNREACHABLE si pas de chemin)
+  next.npy : gare suivante sur le plus court chemin (index de nodes.npy)
+Lecture : les fichiers sont ouverts en memory-map (instantané, partagé entre
+processus) ; une durée se lit en O(1), un chemin en O(longueur du chemin).
+
+Taille : n² x (4 + 2 ou 4) octets, soit ~0.6 Go pour 10k gares.
+
+    python -m back.all_pairs --workers 1 2 4    # temps de construction par nombre de coeurs
+"""
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappush, heappop
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from back import path_finding
+
+UNREACHABLE = np.iinfo(np.uint32).max
+CHUNK = 64  # gares sources par tache envoyee au pool
+
+
+def _next_dtype(n):
+    return np.uint16 if n < np.iinfo(np.uint16).max else np.uint32
+
+
+# --- construction (processus du pool) ---
+_worker = {}
+
+def _init_worker(indptr, indices, weights, directory):
+    _worker["views"] = (indptr.tolist(), indices.tolist(), weights.tolist())
+    _worker["dist"] = np.load(os.path.join(directory, "dist.npy"), mmap_mode="r+")
+    _worker["next"] = np.load(os.path.join(directory, "next.npy"), mmap_mode="r+")
+
+def _one_to_all(views, s):
+    """Distances depuis s et premiere gare apres s sur le chemin (Dijkstra sur les listes CSR)."""
+    indptr, indices, weights = views
+    n = len(indptr) - 1
+    dist = [UNREACHABLE] * n
+    first = [s] * n
+    dist[s] = 0
+    heap = [(0, s)]
+    while heap:
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue
+        hop = first[u]
+        a, b = indptr[u], indptr[u + 1]
+        for v, w in zip(indices[a:b], weights[a:b]):
+            nd = d + w
+            if nd < dist[v]:
+                dist[v] = nd
+                first[v] = v if u == s else hop
+                heappush(heap, (nd, v))
+    return dist, first
+
+def _build_rows(sources):
+    dist_mm, next_mm = _worker["dist"], _worker["next"]
+    for s in sources:
+        dist, first = _one_to_all(_worker["views"], s)
+        dist_mm[s] = dist
+        next_mm[s] = first
+    dist_mm.flush()
+    next_mm.flush()
+    return len(sources)
+
+
+def matrix_path(digest=None):
+    return path_finding.cache_dir / f"apsp_{digest or path_finding.database_digest}_{path_finding.NODE_COL}_v{path_finding.GRAPH_VERSION}"
+
+def build(graph, directory, workers=None):
+    """Construit la matrice de graph dans directory (remplacé d'un coup à la fin). Renvoie la durée en secondes."""
+    workers = workers or os.cpu_count() or 1
+    n = len(graph)
+    directory = os.fspath(directory)
+    tmp = directory + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    t0 = time.perf_counter()
+    np.save(os.path.join(tmp, "nodes.npy"), np.asarray(graph.nodes.tolist(), dtype=str))
+    # fichiers crees a la bonne taille puis remplis ligne par ligne par les processus
+    for name, dtype in (("dist.npy", np.uint32), ("next.npy", _next_dtype(n))):
+        open_memmap(os.path.join(tmp, name), mode="w+", dtype=dtype, shape=(n, n)).flush()
+
+    chunks = [range(i, min(i + CHUNK, n)) for i in range(0, n, CHUNK)]
+    args = (graph.indptr, graph.indices, graph.weights, tmp)
+    if workers == 1:
+        _init_worker(*args)
+        for chunk in chunks:
+            _build_rows(chunk)
+        _worker.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=args) as pool:
+            for _ in pool.map(_build_rows, chunks):
+                pass
+    elapsed = time.perf_counter() - t0
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+    return elapsed
+
+
+# --- lecture ---
+class AllPairs:
+    """Matrice ouverte en memory-map (lecture seule)."""
+
+    def __init__(self, directory):
+        self.nodes = np.load(os.path.join(directory, "nodes.npy")).astype(object)
+        self.node_index = {node: i for i, node in enumerate(self.nodes.tolist())}
+        self.dist = np.load(os.path.join(directory, "dist.npy"), mmap_mode="r")
+        self.next = np.load(os.path.join(directory, "next.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def duration(self, start, goal):
+        """Durée en secondes, ou None si pas de chemin."""
+        s, t = self.node_index.get(start), self.node_index.get(goal)
+        if s is None or t is None:
+            return 0 if start == goal else None
+        d = int(self.dist[s, t])
+        return None if d == UNREACHABLE else d
+
+    def query(self, start, goal, stats=None):
+        """(path, total_s) comme path_finding.dijkstra, en suivant les gares suivantes."""
+        s, t = self.node_index.get(start), self.node_index.get(goal)
+        if s is None or t is None:
+            return ([start], 0) if start == goal else (None, np.inf)
+        total = int(self.dist[s, t])
+        if total == UNREACHABLE:
+            return None, np.inf
+        path = [s]
+        while path[-1] != t:
+            path.append(int(self.next[path[-1], t]))
+        if stats is not None:
+            stats["settled"] = stats.get("settled", 0) + len(path)
+        return self.nodes[path].tolist(), total
+
+    def reachable_within(self, start, seconds):
+        """(ids, durées) des gares atteignables depuis start en au plus seconds, triées par durée
+        (une ligne de la matrice, même résultat que path_finding.reachable)."""
+        s = self.node_index.get(start)
+        if s is None:
+            return np.array([start], dtype=object), np.zeros(1, dtype=np.int64)
+        row = np.asarray(self.dist[s])
+        hits = np.flatnonzero(row <= seconds)
+        hits = hits[np.argsort(row[hits], kind="stable")]
+        return self.nodes[hits], row[hits].astype(np.int64)
+
+
+def load_matrix():
+    """Matrice de la base courante, ou None si elle n'a pas été construite."""
+    path = matrix_path()
+    if not (path / "dist.npy").exists():
+        return None
+    return AllPairs(path)
+
+_current = (None, None)  # (graphe source, matrice)
+_current_lock = threading.Lock()
+
+def _after_fork():
+    global _current_lock
+    _current_lock = threading.Lock()  # processus forke : le verrou du parent peut etre tenu
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def current():
+    """Matrice du graphe courant (rouverte après un rechargement de la base), ou None."""
+    global _current
+    graph, matrix = _current
+    if graph is not path_finding.graph:
+        with _current_lock:
+            graph, matrix = _current
+            if graph is not path_finding.graph:
+                graph = path_finding.graph
+                matrix = load_matrix()
+                _current = (graph, matrix)
+    return matrix
+
+def query(start, goal, stats=None):
+    """Requete point a point sur la matrice ; Dijkstra si la matrice n'a pas ete construite."""
+    matrix = current()
+    if matrix is None:
+        return path_finding.dijkstra(start, goal, stats=stats)
+    return matrix.query(start, goal, stats=stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="matrice des durées entre toutes les paires de gares")
+    parser.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count() or 1],
+                        help="nombre(s) de processus ; plusieurs valeurs : temps de construction pour chacune")
+    args = parser.parse_args()
+
+    graph = path_finding.graph
+    path = matrix_path()
+    n = len(graph)
+    print(f"{n} gares, {n * n * (4 + np.dtype(_next_dtype(n)).itemsize) / 1e6:.1f} Mo")
+    times = {}
+    for workers in args.workers:
+        times[workers] = build(graph, path, workers)
+        print(f"{workers:3d} processus : {times[workers]:.2f}s ({n / times[workers]:.0f} gares sources / s)")
+    base = times[args.workers[0]]
+    if len(times) > 1:
+        print("accélération :", ", ".join(f"{w} -> x{base / t:.2f}" for w, t in times.items()))
+    print("matrice sauvegardée dans", path)
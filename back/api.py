@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+API JSON sur le serveur Flask de Dash (main.py : register_api(server)).
+
+    GET  /api/route?from=Paris Est&to=Metz Ville[&dep_time=08:30:00][&method=astar]
+    GET  /api/stations/nearest?lat=48.85&lon=2.35[&k=5]
+    GET  /api/stations/bbox?south=48.5&west=2.0&north=49.2&east=2.8[&limit=500]
+    GET  /api/reachable?from=Paris Est&max_s=10800[&limit=500]
+    POST /api/phrase   {"phrase": "je veux aller de paris a metz"}
+    POST /api/phrases  {"phrases": ["...", "..."]}
+    POST /api/admin/reload   (en-tête X-Admin-Token, cf. hot_reload)
+
+Le travail (NER, routage) tourne dans un pool de threads borné : au-delà de
+api_workers requêtes en cours + api_queue en attente, l'API répond 503.
+"""
+import hmac
+import math
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import Blueprint, jsonify, request
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+from back import extract_gares, hot_reload, metrics, phrase_controller, snapshot, stations
+from back.batch import jsonable
+
+
+API_WORKERS = int(os.getenv("api_workers") or min(8, os.cpu_count() or 1))
+API_QUEUE = int(os.getenv("api_queue") or 4 * API_WORKERS)
+API_TIMEOUT_S = float(os.getenv("api_timeout_s") or 30)
+MAX_BATCH = 1000  # phrases max par appel a /api/phrases
+MAX_STATIONS = 5000  # gares max renvoyees par /api/stations/*
+ADMIN_TOKEN = os.getenv("admin_token")  # sans jeton, /api/admin/* est desactive
+
+api = Blueprint("api", __name__, url_prefix="/api")
+executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api")
+_slots = threading.BoundedSemaphore(API_WORKERS + API_QUEUE)
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def _api_error(e):
+    return jsonify({"error": e.message}), e.status
+
+
+def run(fn, *args):
+    """Execute fn(*args) dans le pool ; 503 si le pool est sature, 504 si trop long."""
+    if not _slots.acquire(blocking=False):
+        raise ApiError("serveur occupé, réessayez plus tard", 503)
+    try:
+        future = executor.submit(_timed, fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=API_TIMEOUT_S)
+    except TimeoutError:
+        raise ApiError("délai dépassé", 504)
+
+def _timed(fn, *args):
+    # graphe, registre et caches d'une seule version de la base pour toute la requete
+    with snapshot.pinned(), metrics.span(f"api_{fn.__name__}", profile=True):
+        return fn(*args)
+
+def _require_models():
+    error = extract_gares.models_error()
+    if error is not None:
+        raise ApiError(f"modèles NLP indisponibles : {error}", 500)
+    if not extract_gares.models_ready():
+        raise ApiError("chargement des modèles en cours", 503)
+
+def _station(id_):
+    return {"id": id_, "name": stations.registry.name_by_id.get(id_)}
+
+def resolve_station(value, role):
+    """Id de gare connu, ou nom brut -> meilleur candidat (avec la liste classee des candidats)."""
+    if not value:
+        raise ApiError(f"paramètre '{role}' manquant")
+    if value in stations.registry.index_by_id:
+        return {**_station(value), "score": 1.0, "candidates": []}
+    ranked = phrase_controller.ranked_candidates(value)
+    if ranked is None:
+        raise ApiError(f"gare '{value}' introuvable", 404)
+    names, scores, ids = ranked
+    candidates = [{"id": i, "name": n, "score": s} for n, s, i in zip(names, scores, ids)]
+    return {**candidates[0], "candidates": candidates}
+
+
+def route(origin, destination, dep_time=None, method=None):
+    d = resolve_station(origin, "from")
+    a = resolve_station(destination, "to")
+    result = {"from": d, "to": a}
+    if dep_time:
+        # horaires reels : trajet arrivant le plus tot (CSA)
+        from back import timetable
+        try:
+            t0 = timetable.parse_time(dep_time)
+        except ValueError:
+            raise ApiError(f"dep_time invalide : '{dep_time}' (HH:MM ou HH:MM:SS attendu)")
+        path, legs, arrival = timetable.current().earliest_arrival(d["id"], a["id"], t0)
+        result.update(dep_s=t0, arr_s=arrival, total_s=arrival - t0, legs=legs)
+    else:
+        path, total_s = phrase_controller.cached_shortest_path(d["id"], a["id"], method=method)
+        routes = phrase_controller.cached_k_shortest_paths(d["id"], a["id"]) if path is not None else []
+        result.update(total_s=total_s, alternatives=[
+            {"path": [_station(id_) for id_ in p], "total_s": t} for p, t in routes if p != path
+        ][:phrase_controller.MAX_ROUTES - 1])
+    result["path"] = None if path is None else [_station(id_) for id_ in path]
+    return result
+
+def phrase(text):
+    result = phrase_controller.phrase_to_trip(text)
+    if type(result) == str:
+        raise ApiError(result, 422)
+    return result
+
+
+@api.get("/route")
+def api_route():
+    args = request.args
+    method = args.get("method")
+    if method not in (None, "dijkstra", "astar", "ch", "matrix"):
+        raise ApiError(f"method inconnue : '{method}'")
+    return jsonify(jsonable(run(route, args.get("from"), args.get("to"), args.get("dep_time"), method)))
+
+def _float_arg(name, default=None):
+    """Paramètre numérique fini (inf / nan refusés : ils finiraient dans un int())."""
+    value = request.args.get(name, default)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ApiError(f"paramètre '{name}' manquant ou invalide")
+    if not math.isfinite(value):
+        raise ApiError(f"paramètre '{name}' doit être un nombre fini")
+    return value
+
+def _coord_arg(name, bound):
+    """Latitude (bound=90) ou longitude (bound=180) en degrés."""
+    value = _float_arg(name)
+    if not -bound <= value <= bound:
+        raise ApiError(f"{name} doit être entre {-bound} et {bound}")
+    return value
+
+def _limit_arg():
+    """Paramètre limit (défaut et plafond MAX_STATIONS) ; au moins 1."""
+    limit = _float_arg("limit", MAX_STATIONS)
+    if not limit >= 1:
+        raise ApiError("limit doit être au moins 1")
+    return int(min(limit, MAX_STATIONS))
+
+@api.get("/stations/nearest")
+def api_nearest():
+    lat, lon = _coord_arg("lat", 90), _coord_arg("lon", 180)
+    k = int(_float_arg("k", 1))
+    if not 1 <= k <= MAX_STATIONS:
+        raise ApiError(f"k doit être entre 1 et {MAX_STATIONS}")
+    return jsonify(jsonable(stations.nearest_stations(lat, lon, k)))
+
+@api.get("/stations/bbox")
+def api_bbox():
+    south, north = _coord_arg("south", 90), _coord_arg("north", 90)
+    west, east = _coord_arg("west", 180), _coord_arg("east", 180)
+    return jsonify(jsonable(stations.stations_in_bbox(south, west, north, east, max_points=_limit_arg())))
+
+def reachable(origin, max_s, limit):
+    d = resolve_station(origin, "from")
+    ids, durations = phrase_controller.cached_reachable(d["id"], max_s)
+    index = stations.registry.index_by_id
+    reached = [{**stations._station_at(index[id_]), "total_s": t}
+               for id_, t in zip(ids.tolist(), durations.tolist()) if id_ in index]
+    return {"from": d, "max_s": max_s, "count": len(reached), "stations": reached[:limit]}
+
+@api.get("/reachable")
+def api_reachable():
+    max_s = _float_arg("max_s")
+    if max_s < 0:
+        raise ApiError("max_s doit être positif")
+    return jsonify(jsonable(run(reachable, request.args.get("from"), max_s, _limit_arg())))
+
+@api.post("/phrase")
+def api_phrase():
+    body = request.get_json(silent=True) or {}
+    text = body.get("phrase")
+    if not isinstance(text, str) or not text.strip():
+        raise ApiError("champ 'phrase' manquant")
+    if phrase_controller.gazetteer.extract(text) is None:
+        _require_models()
+    return jsonify(jsonable({"phrase": text, "result": run(phrase, text)}))
+
+@api.post("/phrases")
+def api_phrases():
+    body = request.get_json(silent=True) or {}
+    phrases = body.get("phrases")
+    if not isinstance(phrases, list) or not all(isinstance(p, str) for p in phrases):
+        raise ApiError("champ 'phrases' (liste de chaînes) manquant")
+    if len(phrases) > MAX_BATCH:
+        raise ApiError(f"au plus {MAX_BATCH} phrases par appel", 413)
+    _require_models()
+    results = run(phrase_controller.phrases_to_trips, phrases)
+    return jsonify(jsonable([{"phrase": p, "result": r} for p, r in zip(phrases, results)]))
+
+@api.post("/admin/reload")
+def api_reload():
+    if not ADMIN_TOKEN:
+        raise ApiError("administration désactivée (admin_token non défini)", 403)
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise ApiError("jeton d'administration invalide", 403)
+    if hot_reload.in_progress():
+        raise ApiError("rechargement déjà en cours", 409)
+    body = request.get_json(silent=True) or {}
+    try:
+        report = hot_reload.reload_database(force=bool(body.get("force")))
+    except Exception as e:  # l'ancienne base reste en service
+        raise ApiError(f"rechargement impossible : {e}", 500)
+    return jsonify(jsonable(report))
+
+
+def register_api(server):
+    server.register_blueprint(api)
+    return server
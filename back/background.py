@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Exécution des callbacks Dash lourds (phrases : NER, matching, routage) hors du
+thread de requête, via les background callbacks de Dash et une file diskcache.
+
+Chaque job tourne dans un processus forké depuis l'application : les modèles
+NLP déjà chargés sont partagés (copy-on-write), aucun job ne les recharge.
+  - au plus background_workers jobs calculent en même temps (places partagées),
+    les autres attendent leur tour ;
+  - des phrases identiques en cours ne sont calculées qu'une fois : les jobs
+    suivants attendent le premier et relisent son résultat ;
+  - un job remplacé par une nouvelle saisie est tué par Dash (oldJob, SIGKILL) :
+    ses with ne se terminent pas, places et verrous sont donc notés au processus
+    qui les tient et repris dès qu'il n'existe plus (ou après JOB_TIMEOUT_S).
+Les verrous en mémoire des modules (modèles, caches, métriques) sont recréés
+dans chaque processus forké (os.register_at_fork).
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import diskcache
+import psutil
+from dash import DiskcacheManager
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+from back.dataframe import cache_dir
+
+
+BACKGROUND_WORKERS = int(os.getenv("background_workers") or min(4, os.cpu_count() or 1))
+JOB_TIMEOUT_S = float(os.getenv("background_job_timeout_s") or 120)  # places / verrous repris apres ce delai
+RESULT_TTL_S = 600  # resultats gardes pour les phrases identiques
+POLL_S = 0.05  # attente entre deux essais pour une place / un verrou
+JOBS_DIR = cache_dir / "dash_jobs"
+
+cache = diskcache.Cache(str(JOBS_DIR))
+_MISSING = object()
+
+
+def manager(cache_by=None):
+    """DiskcacheManager pour dash.Dash(background_callback_manager=...).
+
+    cache_by : fonctions sans argument ajoutées à la clé des résultats (ex : versions
+    de la base et des modèles) ; les résultats sont gardés RESULT_TTL_S secondes.
+    """
+    return DiskcacheManager(cache, cache_by=cache_by, expire=RESULT_TTL_S if cache_by else None)
+
+def _owner():
+    """(pid, date de création du processus, date de prise) : le pid seul peut être réutilisé."""
+    return os.getpid(), psutil.Process().create_time(), time.time()
+
+def _held(owner):
+    """Vrai si le processus qui a pris la place / le verrou vit encore (et depuis moins de JOB_TIMEOUT_S)."""
+    pid, created, taken = owner
+    if time.time() - taken > JOB_TIMEOUT_S:
+        return False
+    try:
+        process = psutil.Process(pid)
+        return process.create_time() == created and process.status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+@contextmanager
+def worker_slot():
+    """Place parmi les BACKGROUND_WORKERS calculs simultanés (à utiliser avec with)."""
+    owner = _owner()
+    while True:
+        with cache.transact():
+            holders = [o for o in cache.get("workers", default=()) if _held(o)]  # places des jobs tues reprises
+            if len(holders) < BACKGROUND_WORKERS:
+                cache.set("workers", holders + [owner])
+                break
+        time.sleep(POLL_S)
+    try:
+        yield
+    finally:
+        with cache.transact():
+            cache.set("workers", [o for o in cache.get("workers", default=()) if o != owner])
+
+def deduplicated(key, compute, on_wait=None):
+    """compute() une seule fois pour les jobs de même clé en cours ; les suivants attendent
+    le premier (on_wait() est appelé avant d'attendre) puis relisent son résultat."""
+    result = cache.get(("result", key), default=_MISSING)
+    if result is not _MISSING:
+        return result
+    lock, owner, waiting = ("lock", key), _owner(), False
+    while True:
+        with cache.transact():
+            holder = cache.get(lock)
+            if holder is None or not _held(holder):  # verrou d'un job tue : repris
+                cache.set(lock, owner, expire=JOB_TIMEOUT_S)
+                break
+        if not waiting and on_wait is not None:
+            on_wait()
+            waiting = True
+        time.sleep(POLL_S)
+    try:
+        result = cache.get(("result", key), default=_MISSING)
+        if result is _MISSING:
+            result = compute()
+            cache.set(("result", key), result, expire=RESULT_TTL_S)
+    finally:
+        with cache.transact():
+            if cache.get(lock) == owner:
+                cache.delete(lock)
+    return result
+
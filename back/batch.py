@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Traitement en masse de phrases (ex : rejouer les requêtes loguées).
+Une phrase par ligne en entrée (fichier ou stdin), une ligne JSON par phrase en sortie.
+
+    python -m back.batch requetes.txt -o resultats.jsonl --batch-size 128 --n-process 4
+    cat requetes.txt | python -m back.batch > resultats.jsonl
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+
+def jsonable(obj):
+    """Convertit un résultat de phrase_to_trip en objet JSON (inf -> None, types numpy -> python)."""
+    if isinstance(obj, dict):
+        return {k: jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [jsonable(v) for v in obj]
+    if hasattr(obj, "item"):
+        obj = obj.item()
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    return obj
+
+def read_chunks(lines, chunk_size):
+    chunk = []
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def main():
+    parser = argparse.ArgumentParser(description="phrase -> trajet en masse, sortie JSON lines")
+    parser.add_argument("input", nargs="?", default="-", help="fichier de phrases (une par ligne), - pour stdin")
+    parser.add_argument("-o", "--output", default="-", help="fichier JSON lines, - pour stdout")
+    parser.add_argument("--batch-size", type=int, default=64, help="taille de lot pour nlp_ner.pipe / CamemBERT")
+    parser.add_argument("--n-process", type=int, default=1, help="processus spaCy pour nlp_ner.pipe")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="phrases lues avant chaque écriture")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    # les print des modules (chargement de la base...) ne doivent pas polluer la sortie JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        from back import phrase_controller
+        routes = {}
+        n = 0
+        for chunk in read_chunks(src, args.chunk_size):
+            results = phrase_controller.phrases_to_trips(chunk, args.batch_size, args.n_process, routes=routes)
+            for phrase, result in zip(chunk, results):
+                out.write(json.dumps({"phrase": phrase, "result": jsonable(result)}, ensure_ascii=False) + "\n")
+            out.flush()
+            n += len(chunk)
+            hit_rate = phrase_controller.gazetteer.stats()["hit_rate"]
+            print(f"{n} phrases traitées, {len(routes)} trajets distincts, {hit_rate:.0%} sans NER (gazetteer)", file=sys.stderr)
+    for f in (src, out):
+        if f not in (sys.stdin, sys.stdout):
+            f.close()
+
+if __name__ == "__main__":
+    main()
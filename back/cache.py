@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+
+MISSING = object()
+
+
+class LRUCache:
+    """Cache borné (LRU) avec expiration optionnelle (ttl, en secondes) et compteurs hits / misses.
+
+    version : fonction appelée à chaque lecture / écriture (nouvelle base, nouveau
+    modèle...). Chaque entrée est marquée de la version sur laquelle elle a été
+    calculée et n'est servie qu'à une lecture de la même version : une valeur
+    calculée sur l'ancienne base pendant un rechargement n'est jamais relue
+    après. Thread-safe.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=None, version=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _instances.add(self)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _version(self):
+        return self.version() if self.version else None
+
+    def get(self, key, default=MISSING, version=MISSING):
+        if version is MISSING:
+            version = self._version()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires, tag = entry
+                if tag != version:
+                    self.invalidations += 1  # calculee sur une autre version : perimee
+                elif expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, version=MISSING):
+        if version is MISSING:
+            version = self._version()
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires, version)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        version = self._version()  # lue avant le calcul : la version dont le resultat depend
+        value = self.get(key, version=version)
+        if value is MISSING:
+            value = compute()
+            self.set(key, value, version)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+_instances = weakref.WeakSet()
+
+def _after_fork():
+    # processus forke : un verrou tenu par un thread du parent ne serait jamais relache
+    for cache in _instances:
+        cache._lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Contraction Hierarchies sur le graphe de path_finding (best_edges).
+
+Prétraitement optionnel : les gares sont contractées une à une (ordre par
+différence d'arcs) en ajoutant des raccourcis, puis la hiérarchie est
+sauvegardée dans le cache. Une requête ne fait plus qu'une recherche
+bidirectionnelle vers les gares de rang supérieur.
+
+    python -m back.contraction    # construit et sauvegarde la hiérarchie
+"""
+import os
+import sys
+import threading
+import time
+from heapq import heappush, heappop
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+import numpy as np
+
+from back import path_finding
+from back.path_finding import Graph
+
+INF = float("inf")
+WITNESS_LIMIT = 200  # gares fixees au plus par recherche de temoin
+
+
+def _witness(out, source, avoid, max_cost):
+    """Distances depuis source sans passer par avoid, bornees par max_cost."""
+    dist = {source: 0}
+    heap = [(0, source)]
+    settled = 0
+    while heap:
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > max_cost or settled >= WITNESS_LIMIT:
+            break
+        settled += 1
+        for v, w in out[u].items():
+            if v == avoid:
+                continue
+            nd = d + w
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                heappush(heap, (nd, v))
+    return dist
+
+def _shortcuts(v, out, inc):
+    """Raccourcis u -> x (via v) necessaires si v est contractee."""
+    shortcuts = []
+    for u, w_in in inc[v].items():
+        targets = {x: w_in + w_out for x, w_out in out[v].items() if x != u}
+        if not targets:
+            continue
+        dist = _witness(out, u, v, max(targets.values()))
+        for x, cost in targets.items():
+            if dist.get(x, INF) > cost:
+                shortcuts.append((u, x, cost))
+    return shortcuts
+
+
+class ContractionHierarchy:
+    """Rangs des gares + graphes montants (avant / arriere) en CSR et milieux des raccourcis."""
+
+    def __init__(self, nodes, rank, u, v, w, mid):
+        self.nodes = np.asarray(nodes, dtype=object)
+        self.node_index = {node: i for i, node in enumerate(self.nodes.tolist())}
+        self.rank = rank
+        self.edges = (u, v, w, mid)
+
+        up = rank[v] > rank[u]
+        self.up = Graph.from_arrays(self.nodes, u[up], v[up], w[up])
+        # arriere : depuis la cible, on remonte les arcs x -> y avec rank[x] > rank[y]
+        self.down = Graph.from_arrays(self.nodes, v[~up], u[~up], w[~up])
+        self.middle = {(a, b): m for a, b, m in zip(u.tolist(), v.tolist(), mid.tolist()) if m >= 0}
+
+    @classmethod
+    def build(cls, graph):
+        n = len(graph)
+        gu, gv, gw = graph.edges()
+        out = [dict() for _ in range(n)]
+        inc = [dict() for _ in range(n)]
+        edges = {}
+        for a, b, w in zip(gu.tolist(), gv.tolist(), gw.tolist()):
+            if a == b:
+                continue
+            out[a][b] = w
+            inc[b][a] = w
+            edges[(a, b)] = (w, -1)
+
+        deleted = [0] * n
+        def priority(v):
+            return len(_shortcuts(v, out, inc)) - len(out[v]) - len(inc[v]) + deleted[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heap.sort()
+        rank = np.empty(n, dtype=np.int32)
+        level = 0
+        while heap:
+            _, v = heappop(heap)
+            # mise a jour paresseuse : on recalcule avant de contracter
+            p = priority(v)
+            if heap and p > heap[0][0]:
+                heappush(heap, (p, v))
+                continue
+
+            for a, b, cost in _shortcuts(v, out, inc):
+                if cost < out[a].get(b, INF):
+                    out[a][b] = cost
+                    inc[b][a] = cost
+                    edges[(a, b)] = (cost, v)
+            for x in out[v]:
+                del inc[x][v]
+                deleted[x] += 1
+            for x in inc[v]:
+                del out[x][v]
+                deleted[x] += 1
+            out[v].clear()
+            inc[v].clear()
+            rank[v] = level
+            level += 1
+
+        keys = np.array(list(edges.keys()), dtype=np.int32).reshape(-1, 2)
+        vals = np.array(list(edges.values()), dtype=np.int64).reshape(-1, 2)
+        return cls(graph.nodes, rank, keys[:, 0], keys[:, 1], vals[:, 0].astype(np.int32), vals[:, 1].astype(np.int32))
+
+    def save(self, path):
+        u, v, w, mid = self.edges
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, nodes=np.asarray(self.nodes.tolist()), rank=self.rank, u=u, v=v, w=w, mid=mid)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["nodes"].tolist(), data["rank"], data["u"], data["v"], data["w"], data["mid"])
+
+    def _unpack(self, a, b, out):
+        m = self.middle.get((a, b))
+        if m is None:
+            out.append(b)
+        else:
+            self._unpack(a, m, out)
+            self._unpack(m, b, out)
+
+    def query(self, start, goal, stats=None):
+        """Meme contrat que path_finding.dijkstra : (path, total_s) ou (None, inf)."""
+        s, t = self.node_index.get(start), self.node_index.get(goal)
+        if s is None or t is None:
+            return ([start], 0) if start == goal else (None, INF)
+
+        searches = (self.up.views, self.down.views)
+        dist = ({s: 0}, {t: 0})
+        pred = ({s: -1}, {t: -1})
+        heaps = ([(0, s)], [(0, t)])
+        best, meet = INF, -1
+        settled = 0
+        while heaps[0] or heaps[1]:
+            # on avance le cote dont le sommet de tas est le plus petit
+            side = 0 if heaps[0] and (not heaps[1] or heaps[0][0][0] <= heaps[1][0][0]) else 1
+            d, u = heappop(heaps[side])
+            if d >= best:
+                heaps[side].clear()  # ce cote ne peut plus ameliorer le meilleur
+                continue
+            if d > dist[side][u]:
+                continue
+            settled += 1
+            other = dist[1 - side].get(u)
+            if other is not None and d + other < best:
+                best, meet = d + other, u
+            indptr, indices, weights = searches[side]
+            a, b = indptr[u], indptr[u + 1]
+            for v, w in zip(indices[a:b], weights[a:b]):
+                nd = d + w
+                if nd < dist[side].get(v, INF):
+                    dist[side][v] = nd
+                    pred[side][v] = u
+                    heappush(heaps[side], (nd, v))
+
+        if stats is not None:
+            stats["settled"] = stats.get("settled", 0) + settled
+        if meet < 0:
+            return None, INF
+
+        up_chain = [meet]
+        while pred[0][up_chain[-1]] >= 0:
+            up_chain.append(pred[0][up_chain[-1]])
+        up_chain.reverse()
+        down_chain = [meet]
+        while pred[1][down_chain[-1]] >= 0:
+            down_chain.append(pred[1][down_chain[-1]])
+
+        chain = up_chain + down_chain[1:]
+        path = [chain[0]]
+        for a, b in zip(chain, chain[1:]):
+            self._unpack(a, b, path)
+        return self.nodes[path].tolist(), int(best)
+
+
+def hierarchy_path():
+    return path_finding.cache_dir / f"ch_{path_finding.database_digest}_{path_finding.NODE_COL}_v{path_finding.GRAPH_VERSION}.npz"
+
+def load_hierarchy(build=False):
+    """Hierarchie sauvegardee pour la base courante ; la construit si build=True, sinon None."""
+    path = hierarchy_path()
+    if path.exists():
+        return ContractionHierarchy.load(path)
+    if not build:
+        return None
+    t0 = time.perf_counter()
+    ch = ContractionHierarchy.build(path_finding.graph)
+    print(f"contraction hierarchy built in {time.perf_counter() - t0:.1f}s, {len(ch.middle)} raccourcis")
+    ch.save(path)
+    return ch
+
+_current = (None, None)  # (graphe source, hierarchie)
+_current_lock = threading.Lock()
+
+def _after_fork():
+    global _current_lock
+    _current_lock = threading.Lock()  # processus forke : le verrou du parent peut etre tenu
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def current():
+    """Hierarchie du graphe courant si elle a ete preconstruite (python -m back.contraction), sinon None.
+    Jamais construite pendant une requete : la construction est longue sur un grand graphe."""
+    global _current
+    graph, ch = _current
+    if graph is not path_finding.graph:
+        with _current_lock:
+            graph, ch = _current
+            if graph is not path_finding.graph:
+                graph = path_finding.graph
+                ch = load_hierarchy(build=False)
+                _current = (graph, ch)
+    return ch
+
+def query(start, goal, stats=None):
+    """Requete point a point sur la hierarchie ; Dijkstra si la hierarchie n'a pas ete construite."""
+    ch = current()
+    if ch is None:
+        return path_finding.dijkstra(start, goal, stats=stats)
+    return ch.query(start, goal, stats=stats)
+
+
+if __name__ == "__main__":
+    ch = load_hierarchy(build=True)
+    print("hierarchie sauvegardee dans", hierarchy_path())
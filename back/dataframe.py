@@ -1,13 +1,72 @@
 import pandas as pd
+import pyarrow.feather as feather
 from dotenv import load_dotenv
 import os
+import hashlib
+from pathlib import Path
 load_dotenv()
 
 path_to_database = os.getenv('path_to_database')
+cache_dir = Path(os.getenv('path_to_cache') or Path(path_to_database).parent / "cache")
+
+LOADER_VERSION = 1  # a incrementer si les colonnes / dtypes changent (invalide le cache feather)
+
+# colonnes utilisees par l'appli et leurs types compacts
+DTYPES = {
+    "trip_id": "category",
+    "stop_sequence": "int32",
+    "stop_id": "category",
+    "parent_station": "category",
+    "stop_name": "category",
+    "stop_lat": "float32",
+    "stop_lon": "float32",
+    "arrival_time": "category",
+    "departure_time": "category",
+}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Empreinte du contenu d'un fichier, sert de cle aux caches derives de la base."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def read_database_csv(path):
+    """Lecture du csv : seulement les colonnes utiles, types explicites, moteur pyarrow."""
+    columns = pd.read_csv(path, encoding="utf-8", sep=";", nrows=0).columns
+    usecols = [c for c in columns if c in DTYPES]
+    return pd.read_csv(
+        path,
+        encoding="utf-8",
+        sep=";",
+        usecols=usecols,
+        dtype={c: DTYPES[c] for c in usecols},
+        engine="pyarrow",
+    )
+
+def load_database(path, digest):
+    """Base des gares, relue depuis un fichier feather si le csv n'a pas change.
+
+    Le fichier feather evite de reparser le csv au redemarrage ; to_pandas recopie
+    les colonnes, le dataframe obtenu n'est donc pas partage entre processus.
+    """
+    cached = cache_dir / f"database_{digest}_v{LOADER_VERSION}.feather"
+    if cached.exists():
+        return feather.read_table(cached, memory_map=True).to_pandas()
+
+    df = read_database_csv(path)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_suffix(".tmp")
+    feather.write_feather(df, tmp, compression="uncompressed")  # non compresse : lisible en memory-map
+    os.replace(tmp, cached)
+    return df
+
 
 print("start loading database")
 #df = pd.read_excel(path_to_database, sheet_name="Sheet1")
-df = pd.read_csv(path_to_database, encoding="utf-8", sep=";")
+database_digest = file_digest(path_to_database)
+df = load_database(path_to_database, database_digest)
 
 print(f"loaded database , shape = ", df.shape)
-
@@ -3,13 +3,26 @@
 NLP en 3 parties : entrée = phrase → sortie = gare de départ, gare d'arrivée (ou invalid).
 Partie 1 : Préparation (spaCy). Partie 2 : Représentation (BERT/CamemBERT). Partie 3 : Extraction (NER).
 """
+import contextlib
+import os
+import queue
+import sys
+import threading
 from pathlib import Path
+from dotenv import load_dotenv
+load_dotenv()
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+from back import metrics
 
 # --- Partie 1 : Pré-traitement (tokenization, nettoyage) avec spaCy ---
 def partie1_preparation(phrase, nlp_spacy):
-    """Tokenization et nettoyage de la phrase."""
+    """Tokenization et nettoyage de la phrase (tokenizer seul, le reste du pipeline n'est pas utilisé)."""
     phrase = (phrase or "").strip()
-    doc = nlp_spacy(phrase)
+    doc = nlp_spacy.make_doc(phrase)
     tokens = [t.text for t in doc]
     return doc, tokens
 
@@ -28,10 +41,16 @@ def partie2_representation(phrase, tokenizer_bert, model_bert, device):
         out = model_bert(**enc)
     return out.last_hidden_state
 
+def partie2_representation_batch(phrases, tokenizer_bert, model_bert, device):
+    """Partie 2 sur un lot : une seule passe CamemBERT sur un tenseur paddé."""
+    return partie2_representation(list(phrases), tokenizer_bert, model_bert, device)
+
 # --- Partie 3 : Extraction des gares (NER) ---
 def partie3_extraction(doc, nlp_ner):
     """Extrait les entités DEP et ARR du document (NER)."""
-    doc_ner = nlp_ner(doc.text)
+    return entites_depart_arrivee(nlp_ner(doc.text))
+
+def entites_depart_arrivee(doc_ner):
     depart = None
     arrivee = None
     for ent in doc_ner.ents:
@@ -52,12 +71,16 @@ def est_phrase_invalide(phrase):
     return True
 
 def traiter_phrase(phrase, nlp_spacy, nlp_ner, tokenizer_bert, model_bert, device):
-    """Une phrase → départ | arrivée ou invalid."""
+    """Une phrase → départ | arrivée ou invalid. Partie 2 est sautée si model_bert est None."""
     if est_phrase_invalide(phrase):
         return "invalid"
-    doc, _ = partie1_preparation(phrase, nlp_spacy)
-    _ = partie2_representation(phrase, tokenizer_bert, model_bert, device)
-    depart, arrivee = partie3_extraction(doc, nlp_ner)
+    with metrics.span("spacy"):
+        doc, _ = partie1_preparation(phrase, nlp_spacy)
+    if model_bert is not None:
+        with metrics.span("camembert"):
+            _ = partie2_representation(phrase, tokenizer_bert, model_bert, device)
+    with metrics.span("ner"):
+        depart, arrivee = partie3_extraction(doc, nlp_ner)
     if depart is None or arrivee is None:
         return "invalid"
     return {
@@ -65,33 +88,176 @@ def traiter_phrase(phrase, nlp_spacy, nlp_ner, tokenizer_bert, model_bert, devic
         "arrivee":arrivee
     }
 
+def traiter_phrases(phrases, nlp_ner, tokenizer_bert=None, model_bert=None, device=None, batch_size=64, n_process=1):
+    """Version lot de traiter_phrase : nlp_ner.pipe (+ CamemBERT par lots si model_bert)."""
+    phrases = [str(p or "").strip() for p in phrases]
+    valides = [i for i, p in enumerate(phrases) if not est_phrase_invalide(p)]
+    textes = [phrases[i] for i in valides]
+    if model_bert is not None:
+        with metrics.span("camembert_batch"):
+            for k in range(0, len(textes), batch_size):
+                _ = partie2_representation_batch(textes[k:k + batch_size], tokenizer_bert, model_bert, device)
+
+    resultats = ["invalid"] * len(phrases)
+    with metrics.span("ner_batch"):
+        for i, doc_ner in zip(valides, nlp_ner.pipe(textes, batch_size=batch_size, n_process=n_process)):
+            depart, arrivee = entites_depart_arrivee(doc_ner)
+            if depart is not None and arrivee is not None:
+                resultats[i] = {"depart":depart, "arrivee":arrivee}
+    return resultats
 
-import spacy
-import torch
-from transformers import AutoTokenizer, AutoModel
 
+# --- Chargement paresseux des modèles ---
 base = Path(__file__).parent
-model_ner_path = base / "model_ner"
+model_ner_path = Path(os.getenv("path_to_model_ner") or base / "model_ner")
+# CamemBERT (Partie 2) n'a aucun consommateur aval : désactivé sauf use_camembert=1
+USE_CAMEMBERT = os.getenv("use_camembert", "0") == "1"
+
+_models = {}
+_load_error = None  # exception du dernier load_models en echec
+_models_lock = threading.Lock()
+# un pipeline NER spaCy n'est pas garanti thread-safe : chaque inference emprunte sa propre
+# instance, au plus NER_POOL_SIZE (une par worker de l'API) ; CamemBERT (torch, eval) est partage
+NER_POOL_SIZE = int(os.getenv("ner_pool_size") or os.getenv("api_workers") or min(8, os.cpu_count() or 1))
+_ner_pool = queue.Queue()
+_ner_instances = []  # toutes les instances chargees (pretees ou non)
+_ner_created = 0     # instances chargees ou en cours de chargement
+
+def _load(name, loader):
+    model = _models.get(name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(name)
+            if model is None:
+                model = _models[name] = loader()
+    return model
+
+def _load_spacy():
+    import spacy
+    try:
+        return spacy.load("fr_core_news_sm")
+    except OSError:
+        print("Téléchargement du modèle spaCy français : fr_core_news_sm")
+        spacy.cli.download("fr_core_news_sm")
+        return spacy.load("fr_core_news_sm")
+
+def _load_ner():
+    import spacy
+    return spacy.load(model_ner_path)
+
+def _load_bert():
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+    threads = os.getenv("torch_threads")  # fixe par prefork.post_fork : coeurs / workers gunicorn
+    if threads:
+        torch.set_num_threads(int(threads))
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    tokenizer_bert = AutoTokenizer.from_pretrained("camembert-base")
+    model_bert = AutoModel.from_pretrained("camembert-base").to(device)
+    model_bert.eval()
+    return tokenizer_bert, model_bert, device
 
-try:
-    nlp_spacy = spacy.load("fr_core_news_sm")
-except OSError:
-    print("Téléchargement du modèle spaCy français : fr_core_news_sm")
-    spacy.cli.download("fr_core_news_sm")
-    nlp_spacy = spacy.load("fr_core_news_sm")
+def get_nlp_spacy():
+    return _load("spacy", _load_spacy)
 
+def get_nlp_ner():
+    return _load("ner", _load_ner)
 
-nlp_ner = spacy.load(model_ner_path)
+def _new_ner():
+    """Nouvelle instance du pipeline NER, ou None si les NER_POOL_SIZE instances existent déjà."""
+    global _ner_created
+    with _models_lock:
+        if _ner_created >= NER_POOL_SIZE:
+            return None
+        first = _ner_created == 0
+        _ner_created += 1
+    try:
+        nlp_ner = get_nlp_ner() if first else _load_ner()  # la premiere est celle de get_nlp_ner
+    except BaseException:
+        with _models_lock:
+            _ner_created -= 1
+        raise
+    _ner_instances.append(nlp_ner)
+    return nlp_ner
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-tokenizer_bert = AutoTokenizer.from_pretrained("camembert-base")
-model_bert = AutoModel.from_pretrained("camembert-base").to(device)
-model_bert.eval()
+@contextlib.contextmanager
+def ner_pipeline():
+    """Instance du pipeline NER réservée à l'appelant le temps du with (attend si toutes sont prises)."""
+    try:
+        nlp_ner = _ner_pool.get_nowait()
+    except queue.Empty:
+        nlp_ner = _new_ner() or _ner_pool.get()
+    try:
+        yield nlp_ner
+    finally:
+        _ner_pool.put(nlp_ner)
+
+def _after_fork():
+    """Processus forké (job Dash, worker gunicorn) : verrous et pool recréés. Les threads
+    du parent (chargement des modèles, requêtes de l'API) n'existent pas dans l'enfant :
+    un verrou qu'ils tenaient ou une instance NER empruntée ne serait jamais rendue."""
+    global _models_lock, _ner_pool, _ner_created
+    _models_lock = threading.Lock()
+    _ner_pool = queue.Queue()
+    for nlp_ner in _ner_instances:
+        _ner_pool.put(nlp_ner)
+    _ner_created = len(_ner_instances)
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def get_bert():
+    """(tokenizer, model, device), ou (None, None, None) si CamemBERT est désactivé."""
+    if not USE_CAMEMBERT:
+        return None, None, None
+    return _load("bert", _load_bert)
+
+def load_models():
+    """Charge tous les modèles utiles (à lancer en tâche de fond au démarrage).
+    En cas d'échec, l'erreur est gardée (models_error) puis relancée."""
+    global _load_error
+    try:
+        get_nlp_spacy()
+        get_nlp_ner()
+        get_bert()
+        while (nlp_ner := _new_ner()) is not None:  # pool NER complet avant les premieres requetes
+            _ner_pool.put(nlp_ner)
+    except Exception as e:
+        _load_error = e
+        print("échec du chargement des modèles NLP :", repr(e))
+        raise
+    _load_error = None
+
+def model_version():
+    """Change quand le modèle NER sur disque est réentraîné (sert à invalider les caches)."""
+    try:
+        return os.stat(model_ner_path / "meta.json").st_mtime_ns
+    except OSError:
+        return None
+
+def models_error():
+    """Message de l'échec du dernier chargement des modèles, ou None."""
+    return None if _load_error is None else f"{type(_load_error).__name__}: {_load_error}"
+
+def models_ready():
+    return "spacy" in _models and "ner" in _models and (not USE_CAMEMBERT or "bert" in _models)
 
 
 def extract_stations(phrase):
-    station_dict = traiter_phrase(phrase, nlp_spacy, nlp_ner, tokenizer_bert, model_bert, device)
+    tokenizer_bert, model_bert, device = get_bert()
+    nlp_spacy = get_nlp_spacy()
+    with ner_pipeline() as nlp_ner:
+        station_dict = traiter_phrase(phrase, nlp_spacy, nlp_ner, tokenizer_bert, model_bert, device)
     print('station dict',station_dict)
+    return trip_information_from(station_dict)
+
+def extract_stations_batch(phrases, batch_size=64, n_process=1):
+    """extract_stations sur une liste de phrases, en lots."""
+    tokenizer_bert, model_bert, device = get_bert()
+    with ner_pipeline() as nlp_ner:
+        station_dicts = traiter_phrases(phrases, nlp_ner, tokenizer_bert, model_bert, device, batch_size, n_process)
+    return [trip_information_from(d) for d in station_dicts]
+
+def trip_information_from(station_dict):
     if station_dict != 'invalid' :
         if station_dict['depart'] and station_dict['arrivee']:
             trip_information = {
@@ -109,16 +275,5 @@ if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1:
         phrase = " ".join(sys.argv[1:])
-        import spacy
-        import torch
-        from transformers import AutoTokenizer, AutoModel
-        base = Path(__file__).parent
-        model_ner_path = base / "model_ner"
-        nlp_spacy = spacy.load("fr_core_news_sm")
-        nlp_ner = spacy.load(model_ner_path)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        tokenizer_bert = AutoTokenizer.from_pretrained("camembert-base")
-        model_bert = AutoModel.from_pretrained("camembert-base").to(device)
-        model_bert.eval()
-        print(traiter_phrase(phrase, nlp_spacy, nlp_ner, tokenizer_bert, model_bert, device))
-    
+        tokenizer_bert, model_bert, device = get_bert()
+        print(traiter_phrase(phrase, get_nlp_spacy(), get_nlp_ner(), tokenizer_bert, model_bert, device))
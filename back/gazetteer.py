@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Extraction rapide départ / arrivée sans modèle : automate d'Aho-Corasick sur les
+noms de gares normalisés (par tokens) + prépositions qui marquent le départ
+(« de », « depuis », « au départ de »...) et l'arrivée (« à », « vers », « pour »...).
+
+    g = Gazetteer(noms_de_gares)
+    g.extract("je veux aller de Paris à Metz")
+    -> {"depart": "Paris", "arrivee": "Metz", "confidence": 0.95}
+
+Les formes simples sont résolues en quelques microsecondes ; si la phrase est
+ambiguë (plusieurs gares possibles pour un rôle, aucun marqueur...) extract
+renvoie None et l'appelant passe par le NER (extract_gares).
+"""
+import os
+import re
+import sys
+import threading
+import weakref
+from collections import deque
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+from back.matching import normalize, BAD_TOKENS, GOOD_TOKENS
+
+
+# marqueurs (tokens normalises), les plus longs sont testes en premier
+DEPART_MARKERS = [("au", "depart", "de"), ("en", "provenance", "de"), ("en", "partant", "de"), ("partant", "de"),
+                  ("depuis",), ("de",), ("d",), ("du",)]
+ARRIVEE_MARKERS = [("a", "destination", "de"), ("en", "direction", "de"), ("jusqu", "a"), ("arrivee", "a"),
+                   ("a",), ("au",), ("vers",), ("pour",), ("direction",)]
+MARKERS = sorted([(m, "depart") for m in DEPART_MARKERS] + [(m, "arrivee") for m in ARRIVEE_MARKERS],
+                 key=lambda x: -len(x[0]))
+
+# mots qui ne peuvent pas constituer a eux seuls un nom de gare (ex : la commune « Vers ») :
+# ni cle du gazetteer, ni fin de prefixe
+STOPWORDS = {t for m, _ in MARKERS for t in m} | GOOD_TOKENS | BAD_TOKENS | {
+    "je", "j", "tu", "il", "on", "nous", "vous", "veux", "voudrais", "souhaite", "aimerais", "aller", "partir",
+    "rendre", "me", "y", "un", "une", "le", "la", "les", "l", "des", "aux", "et", "ou", "en", "train", "trains",
+    "billet", "trajet", "comment", "quel", "quels", "demain", "aujourd", "hui", "ce", "soir", "matin", "s", "plait",
+    "saint", "st", "sainte", "ste",
+}
+
+# confiance selon la facon dont les roles ont ete attribues
+CONF_MARKED = 0.95      # depart et arrivee introduits par un marqueur
+CONF_ONE_MARKED = 0.85  # un seul marqueur, l'autre gare est deduite
+CONF_ORDER = 0.6        # aucun marqueur : « paris metz » -> ordre de la phrase
+MIN_CONFIDENCE = float(os.getenv("gazetteer_min_confidence") or 0.8)
+
+_token_re = re.compile(r"[^\W_]+")
+
+
+def tokens_with_spans(phrase):
+    """Tokens normalises (cf. matching.normalize) avec leur position dans la phrase d'origine."""
+    out = []
+    for m in _token_re.finditer(phrase):
+        for tok in normalize(m.group()).split():
+            out.append((tok, m.start(), m.end()))
+    return out
+
+
+class Gazetteer:
+    """Automate d'Aho-Corasick dont l'alphabet est l'ensemble des tokens des noms de gares.
+
+    Clés : noms complets normalisés et leurs préfixes en tokens (« paris » pour
+    « Paris Est »), sauf les préfixes qui se terminent par un mot vide / marqueur.
+    """
+
+    def __init__(self, names):
+        self.hits = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        _instances.add(self)
+
+        self._goto = {}        # (etat, token) -> etat
+        self._fail = [0]
+        self._out = [0]        # longueur (en tokens) de la plus longue cle finissant dans l'etat, 0 sinon
+        self._dict_link = [0]  # etat suivant (par les liens d'echec) qui porte une cle
+        for name in names:
+            tokens = normalize(str(name)).split()
+            state = 0
+            for k, tok in enumerate(tokens):
+                nxt = self._goto.get((state, tok))
+                if nxt is None:
+                    nxt = self._goto[(state, tok)] = len(self._fail)
+                    self._fail.append(0)
+                    self._out.append(0)
+                    self._dict_link.append(0)
+                state = nxt
+                # nom complet, sauf s'il se reduit a un mot vide (« Vers » : la phrase passe alors
+                # par le NER), ou prefixe qui ne se termine pas par un mot vide
+                if (k + 1 == len(tokens) and (k or tok not in STOPWORDS)
+                        or tok not in STOPWORDS and (k or len(tok) >= 3)):
+                    self._out[state] = k + 1
+        self.keys = sum(1 for o in self._out if o)
+
+        # liens d'echec en largeur
+        children = {}
+        for (state, tok), nxt in self._goto.items():
+            children.setdefault(state, []).append((tok, nxt))
+        queue = deque(nxt for _, nxt in children.get(0, ()))
+        while queue:
+            state = queue.popleft()
+            for tok, nxt in children.get(state, ()):
+                f = self._fail[state]
+                while f and (f, tok) not in self._goto:
+                    f = self._fail[f]
+                target = self._goto.get((f, tok), 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._dict_link[nxt] = self._fail[nxt] if self._out[self._fail[nxt]] else self._dict_link[self._fail[nxt]]
+                queue.append(nxt)
+
+    def matches(self, tokens):
+        """Occurrences (debut, fin) de cles, la plus longue a gauche d'abord, sans chevauchement."""
+        found = []
+        state = 0
+        for i, tok in enumerate(tokens):
+            while state and (state, tok) not in self._goto:
+                state = self._fail[state]
+            state = self._goto.get((state, tok), 0)
+            s = state if self._out[state] else self._dict_link[state]
+            while s:
+                found.append((i + 1 - self._out[s], i + 1))
+                s = self._dict_link[s]
+        found.sort(key=lambda m: (m[0], m[0] - m[1]))
+        kept, end = [], 0
+        for start, stop in found:
+            if start >= end:
+                kept.append((start, stop))
+                end = stop
+        return kept
+
+    def extract(self, phrase):
+        """{"depart", "arrivee", "confidence"} si la phrase est résolue avec assez de confiance, sinon None."""
+        spans = tokens_with_spans(str(phrase or ""))
+        tokens = [t for t, _, _ in spans]
+        roles = {"depart": [], "arrivee": [], None: []}
+        for start, stop in self.matches(tokens):
+            role = None
+            for marker, r in MARKERS:
+                if tuple(tokens[max(0, start - len(marker)):start]) == marker:
+                    role = r
+                    break
+            roles[role].append(phrase[spans[start][1]:spans[stop - 1][2]])
+
+        dep, arr, other = roles["depart"], roles["arrivee"], roles[None]
+        if len(dep) == 1 and len(arr) == 1 and not other:
+            depart, arrivee, confidence = dep[0], arr[0], CONF_MARKED
+        elif len(dep) == 1 and not arr and len(other) == 1:
+            depart, arrivee, confidence = dep[0], other[0], CONF_ONE_MARKED
+        elif len(arr) == 1 and not dep and len(other) == 1:
+            depart, arrivee, confidence = other[0], arr[0], CONF_ONE_MARKED
+        elif not dep and not arr and len(other) == 2:
+            depart, arrivee, confidence = other[0], other[1], CONF_ORDER
+        else:
+            return None
+        if depart.lower() == arrivee.lower() or confidence < MIN_CONFIDENCE:
+            return None
+        return {"depart": depart, "arrivee": arrivee, "confidence": confidence}
+
+    def resolve(self, phrase):
+        """extract + comptage des phrases résolues / renvoyées au NER."""
+        result = self.extract(phrase)
+        with self._lock:
+            if result is None:
+                self.fallbacks += 1
+            else:
+                self.hits += 1
+        return result
+
+    def stats(self):
+        total = self.hits + self.fallbacks
+        return {
+            "keys": self.keys,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_instances = weakref.WeakSet()
+
+def _after_fork():
+    # processus forke : un verrou tenu par un thread du parent ne serait jamais relache
+    for gazetteer in _instances:
+        gazetteer._lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Rechargement à chaud de la base des gares (path_to_database) sans redémarrer le
+processus ni recharger les modèles NLP.
+
+Les trips de l'ancienne et de la nouvelle base sont comparés par trip_id
+(empreinte de leurs lignes) : seuls les trips ajoutés / modifiés sont
+renormalisés et leurs arcs recalculés, et seuls les couples OD touchés voient
+leur minimum recalculé. Le graphe, le registre des gares, le matcher, le
+gazetteer et l'index spatial sont construits à côté des anciens, réunis dans un
+snapshot et publiés par une seule affectation : les requêtes en cours finissent
+sur l'ancien snapshot (snapshot.pinned), et les entrées de cache, marquées de
+la version sur laquelle elles ont été calculées, ne sont plus relues.
+
+    POST /api/admin/reload          (en-tête X-Admin-Token = admin_token du .env)
+    reload_interval_s=30 dans le .env : surveillance du fichier en tâche de fond
+"""
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+from back import dataframe, metrics, path_finding, snapshot, stations
+from back.gazetteer import Gazetteer
+from back.matching import StationMatcher
+from back.path_finding import Graph, NODE_COL
+
+
+RELOAD_INTERVAL_S = float(os.getenv("reload_interval_s") or 0)  # 0 : pas de surveillance du fichier
+
+_lock = threading.Lock()  # un seul rechargement a la fois
+
+
+def trip_fingerprints(df):
+    """Empreinte (uint64) des lignes de chaque trip, indexée par trip_id (str)."""
+    cols = [c for c in dataframe.DTYPES if c in df.columns]
+    rows = pd.util.hash_pandas_object(df[cols], index=False).to_numpy()
+    trips = df["trip_id"].astype(str).to_numpy(dtype=object)
+    # somme des empreintes des lignes : independante de l'ordre des lignes dans le csv
+    return pd.Series(rows, index=trips).groupby(level=0, sort=False).sum()
+
+def _rows_of(df, trips):
+    """Positions des lignes des trips, triées par (trip_id, stop_sequence)."""
+    trip_ids = df["trip_id"].astype(str).to_numpy(dtype=object)
+    pos = np.flatnonzero(pd.Index(trips).get_indexer(trip_ids) >= 0)
+    return pos[np.lexsort((df["stop_sequence"].to_numpy()[pos], trip_ids[pos].astype(str)))]
+
+def _od(edges):
+    return pd.MultiIndex.from_arrays([edges["u"].to_numpy(dtype=object), edges["v"].to_numpy(dtype=object)])
+
+
+def rebuild(old_df, new_df, old_trip_edges, old_best_edges):
+    """Colonnes dep/arr, arcs par trip et meilleurs arcs OD de new_df, en ne recalculant que les trips modifiés."""
+    old_fp, new_fp = trip_fingerprints(old_df), trip_fingerprints(new_df)
+    common = old_fp.index.intersection(new_fp.index)
+    unchanged = common[old_fp[common].to_numpy() == new_fp[common].to_numpy()]
+    changed = new_fp.index.difference(unchanged)  # ajoutes ou modifies
+    stale = old_fp.index.difference(unchanged)    # retires ou modifies
+
+    # heures normalisees : recopiees pour les trips inchanges, recalculees pour les autres
+    dep = np.full(len(new_df), np.nan)
+    arr = np.full(len(new_df), np.nan)
+    new_pos, old_pos = _rows_of(new_df, unchanged), _rows_of(old_df, unchanged)
+    dep[new_pos] = old_df["dep_s_norm"].to_numpy()[old_pos]
+    arr[new_pos] = old_df["arr_s_norm"].to_numpy()[old_pos]
+    pos = _rows_of(new_df, changed)
+    work = new_df.iloc[pos][["trip_id", "stop_sequence", NODE_COL, "departure_time", "arrival_time"]]
+    work = work.assign(trip_id=work["trip_id"].astype(str))
+    work["dep_s_norm"] = path_finding.normalize_times_per_trip(work, "departure_time")
+    work["arr_s_norm"] = path_finding.normalize_times_per_trip(work, "arrival_time")
+    dep[pos], arr[pos] = work["dep_s_norm"].to_numpy(), work["arr_s_norm"].to_numpy()
+    new_df["dep_s_norm"], new_df["arr_s_norm"] = dep, arr
+
+    # arcs par trip : anciens arcs des trips inchanges + arcs des trips modifies
+    is_stale = old_trip_edges["trip_id"].isin(stale)
+    fresh = path_finding.trip_edges_from(path_finding.build_edges(work))
+    trip_edges = pd.concat([old_trip_edges[~is_stale], fresh], ignore_index=True)
+
+    # minimum par OD recalcule uniquement pour les OD touches
+    affected = _od(old_trip_edges[is_stale]).append(_od(fresh)).unique()
+    kept = old_best_edges[~_od(old_best_edges).isin(affected)]
+    redone = path_finding.best_edges_from(trip_edges[_od(trip_edges).isin(affected)])
+    best_edges = pd.concat([kept, redone], ignore_index=True)
+    stats = {"trips": len(new_fp), "changed_trips": len(changed), "removed_trips": len(old_fp.index.difference(new_fp.index)),
+             "affected_od": len(affected), "edges": len(best_edges)}
+    return new_df, trip_edges, best_edges, stats
+
+
+def reload_database(path=None, force=False):
+    """Recharge la base si son contenu a changé ; renvoie un résumé (dict). Lève l'erreur sans rien publier en cas d'échec."""
+    with _lock, metrics.span("reload"):
+        t0 = time.perf_counter()
+        old = snapshot.current()
+        path = path or old.path
+        digest = dataframe.file_digest(path)
+        if digest == old.version and not force:
+            return {"changed": False, "version": digest}
+
+        new_df = dataframe.load_database(path, digest)
+        new_df = new_df.sort_values(["trip_id", "stop_sequence"]).reset_index(drop=True)
+        new_df, trip_edges, best_edges, stats = rebuild(old.df, new_df, old.trip_edges, old.best_edges)
+
+        graph = Graph.from_edges(best_edges, path_finding.node_coordinates(new_df))
+        graph.version = digest
+        path_finding.save_graph_cache(path_finding.graph_cache_path(digest), new_df, best_edges, trip_edges)
+        registry = stations.StationRegistry.from_dataframe(new_df)
+        registry.version = digest
+        spatial = stations.build_spatial_index(registry)
+        matcher = StationMatcher(registry.index_by_name)
+        gazetteer = Gazetteer(registry.index_by_name)
+        gazetteer.hits, gazetteer.fallbacks = old.gazetteer.hits, old.gazetteer.fallbacks
+
+        # publication : une seule affectation, aucune requete en cours n'est bloquee
+        snapshot.publish(old._replace(version=digest, path=path, df=new_df, trip_edges=trip_edges, best_edges=best_edges,
+                                      graph=graph, registry=registry, spatial=spatial, matcher=matcher, gazetteer=gazetteer))
+        timetable = sys.modules.get("back.timetable")  # charge a la demande par l'API
+        if timetable:
+            timetable.current()  # horaires de la nouvelle base, hors du chemin des requetes
+
+        stats.update(changed=True, version=digest, stations=len(registry), seconds=round(time.perf_counter() - t0, 3))
+        print("base rechargée :", stats)
+        return stats
+
+def in_progress():
+    return _lock.locked()
+
+
+def watch(interval=RELOAD_INTERVAL_S):
+    """Boucle de surveillance : recharge quand la date / taille du fichier change."""
+    def signature():
+        st = os.stat(snapshot.current().path)
+        return st.st_mtime_ns, st.st_size
+    last = signature()
+    while True:
+        time.sleep(interval)
+        try:
+            current = signature()
+            if current != last:
+                last = current
+                reload_database()
+        except Exception as e:  # fichier en cours d'ecriture, csv invalide... : on garde l'ancienne base
+            print("rechargement de la base impossible :", e)
+
+def start_watcher(interval=RELOAD_INTERVAL_S):
+    if interval <= 0:
+        return None
+    thread = threading.Thread(target=watch, args=(interval,), name="reload-watcher", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,119 @@
+import os
+import sys
+import re
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+
+BAD_TOKENS = {"rue", "route", "eglise", "église", "avenue", "bd", "boulevard"}
+GOOD_TOKENS = {"gare", "centre", "ville"}
+
+TOKEN_BONUS = 0.20      # la requete est un mot entier du nom (metz -> "metz ville")
+PREFIX_PENALTY = 0.35   # piege du prefixe (metz -> metzeral, metzing...)
+HEURISTIC_DELTA = 0.05  # GOOD_TOKENS / BAD_TOKENS
+
+TOP_K = 10
+SCORE_CUTOFF = 0.5
+
+
+def normalize(s: str) -> str:
+    s = s.strip().lower()
+    s = unicodedata.normalize("NFD", s)
+    s = "".join(c for c in s if unicodedata.category(c) != "Mn")  # remove accents
+    s = re.sub(r"[-'’]", " ", s)
+    s = re.sub(r"[^a-z0-9\s]", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+class StationMatcher:
+    """Noms de gares normalisés et tokenisés une seule fois, scorés par lots avec rapidfuzz.
+
+    Les règles de best_station_match (bonus mot entier, pénalité de préfixe,
+    tokens heuristiques) sont appliquées comme ajustements vectoriels.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.norm_names = [normalize(str(n)) for n in self.names]
+        self.index_by_name = {}
+        for i, name in enumerate(self.names):
+            self.index_by_name.setdefault(name, i)
+
+        self.exact = {}
+        self.token_postings = {}
+        self.static_bonus = np.zeros(len(self.names), dtype=np.float64)
+        first_tokens = []
+        for i, norm in enumerate(self.norm_names):
+            self.exact.setdefault(norm, []).append(i)
+            tokens = norm.split()
+            for t in set(tokens):
+                self.token_postings.setdefault(t, []).append(i)
+            if any(t in GOOD_TOKENS for t in tokens):
+                self.static_bonus[i] += HEURISTIC_DELTA
+            if any(t in BAD_TOKENS for t in tokens):
+                self.static_bonus[i] -= HEURISTIC_DELTA
+            first_tokens.append(tokens[0] if tokens else "")
+        self.token_postings = {t: np.array(p, dtype=np.int32) for t, p in self.token_postings.items()}
+
+        # premiers tokens tries : les noms commencant par la requete forment un intervalle
+        self._first_order = np.argsort(np.array(first_tokens, dtype=object), kind="stable").astype(np.int32)
+        self._first_sorted = [first_tokens[i] for i in self._first_order]
+
+    def positions(self, names):
+        return np.array([self.index_by_name[n] for n in names if n in self.index_by_name], dtype=np.int32)
+
+    def _prefix_positions(self, q):
+        lo = bisect_left(self._first_sorted, q)
+        hi = bisect_left(self._first_sorted, q + "\U0010ffff")
+        return self._first_order[lo:hi]
+
+    def score(self, query, positions=None):
+        """Scores ajustés de la requête contre les gares `positions` (toutes si None)."""
+        if positions is None:
+            positions = np.arange(len(self.names), dtype=np.int32)
+        return self._score(normalize(query), positions)
+
+    def _score(self, q, positions):
+        choices = [self.norm_names[i] for i in positions.tolist()]
+        scores = process.cdist([q], choices, scorer=fuzz.WRatio, dtype=np.float64)[0] / 100.0
+
+        full_token = np.isin(positions, self.token_postings.get(q, ()))
+        prefix_trap = np.isin(positions, self._prefix_positions(q)) & ~full_token
+        scores += TOKEN_BONUS * full_token
+        scores -= PREFIX_PENALTY * prefix_trap
+        scores += self.static_bonus[positions]
+        return scores
+
+    def match(self, query, positions=None, limit=TOP_K, score_cutoff=SCORE_CUTOFF):
+        """Meilleures gares pour la requête : (noms, scores) triés par score décroissant.
+
+        Une correspondance exacte (après normalisation) l'emporte avec un score de 1.0.
+        """
+        if positions is None:
+            positions = np.arange(len(self.names), dtype=np.int32)
+        if not len(positions):
+            return [], []
+
+        q = normalize(query)
+        exact = self.exact.get(q)
+        if exact:
+            hits = positions[np.isin(positions, exact)]
+            if len(hits):
+                return [self.names[hits[0]]], [1.0]
+
+        scores = self._score(q, positions)
+        order = np.argsort(-scores, kind="stable")
+        if score_cutoff is not None:
+            kept = order[scores[order] >= score_cutoff]
+            order = kept if len(kept) else order[:1]  # toujours au moins le meilleur candidat
+        if limit is not None:
+            order = order[:limit]
+        return [self.names[i] for i in positions[order].tolist()], scores[order].tolist()
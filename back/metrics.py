@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Mesures de latence par étape (spaCy, NER, candidats, matching, routage, carte...)
+et compteurs (candidats, gares fixées), exposés au format Prometheus sur /metrics.
+
+    with metrics.span("ner"):
+        ...
+    metrics.observe("candidates", len(names))
+
+Profilage des requêtes lentes (optionnel) : avec profile_slow_ms=500 dans le .env,
+les spans ouverts avec profile=True sont profilés par cProfile et, s'ils dépassent
+le seuil, le profil est écrit dans profile_dir (lisible avec pstats / snakeviz).
+"""
+import cProfile
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask import Response
+
+
+WINDOW = 4096                    # dernieres mesures gardees par serie pour les quantiles
+QUANTILES = (0.5, 0.95, 0.99)
+PREFIX = "travel_recorder"
+
+PROFILE_SLOW_MS = float(os.getenv("profile_slow_ms") or 0)
+PROFILE_DIR = Path(os.getenv("profile_dir") or Path(__file__).parent / "profiles")
+
+
+class Summary:
+    """Série de mesures : total / nombre depuis le démarrage, quantiles sur une fenêtre glissante."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self):
+        values = sorted(self.samples)
+        if not values:
+            return {q: float("nan") for q in QUANTILES}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in QUANTILES}
+
+
+# nom de metrique -> (aide, {etiquette: Summary})
+_metrics = {
+    "stage_seconds": ("Durée de chaque étape du traitement d'une requête", {}),
+    "candidates": ("Nombre de gares candidates pour un nom brut", {}),
+    "settled_nodes": ("Gares fixées par une recherche de plus court chemin", {}),
+}
+_lock = threading.Lock()
+_profile_lock = threading.Lock()  # un seul profil cProfile actif a la fois
+
+def _after_fork():
+    # processus forke (job Dash, worker gunicorn) : les verrous du parent peuvent etre tenus
+    global _lock, _profile_lock
+    _lock, _profile_lock = threading.Lock(), threading.Lock()
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def observe(metric, value, label=""):
+    _, series = _metrics[metric]
+    with _lock:
+        summary = series.get(label)
+        if summary is None:
+            summary = series[label] = Summary()
+        summary.observe(value)
+
+@contextmanager
+def span(stage, profile=False):
+    """Chronomètre une étape (stage_seconds{stage=...}) ; profile=True : profil si requête lente."""
+    profiler = None
+    if profile and PROFILE_SLOW_MS and _profile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        profiler.enable()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        observe("stage_seconds", elapsed, stage)
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                dump_profile(profiler, stage, elapsed)
+
+def dump_profile(profiler, stage, elapsed):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR / f"{stage}_{time.strftime('%Y%m%d-%H%M%S')}_{int(elapsed * 1000)}ms.prof"
+    profiler.dump_stats(path)
+    print(f"requête lente ({stage}, {elapsed * 1000:.0f} ms) : profil écrit dans {path}")
+
+
+def _line(name, value, labels=None):
+    if labels:
+        inner = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        name = f"{name}{{{inner}}}"
+    return f"{name} {value}"
+
+def render(extra_gauges=None):
+    """Texte au format Prometheus : une métrique summary par série, plus des jauges libres."""
+    lines = []
+    with _lock:
+        snapshot = {
+            metric: (doc, {label: (s.quantiles(), s.sum, s.count) for label, s in series.items()})
+            for metric, (doc, series) in _metrics.items()
+        }
+    for metric, (doc, series) in snapshot.items():
+        name = f"{PREFIX}_{metric}"
+        lines.append(f"# HELP {name} {doc}")
+        lines.append(f"# TYPE {name} summary")
+        key = "stage" if metric == "stage_seconds" else "kind"
+        for label, (quantiles, total, count) in sorted(series.items()):
+            labels = {key: label} if label else {}
+            for q, v in quantiles.items():
+                lines.append(_line(name, v, {**labels, "quantile": q}))
+            lines.append(_line(f"{name}_sum", total, labels))
+            lines.append(_line(f"{name}_count", count, labels))
+    for gauge, (doc, values) in (extra_gauges or {}).items():
+        name = f"{PREFIX}_{gauge}"
+        lines.append(f"# HELP {name} {doc}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in values:
+            lines.append(_line(name, value, labels))
+    return "\n".join(lines) + "\n"
+
+def cache_gauges():
+    from back import phrase_controller
+    stats = phrase_controller.cache_stats()
+    gauges = {}
+    for field in ("size", "hits", "misses", "hit_rate", "evictions", "invalidations"):
+        gauges[f"cache_{field}"] = (f"Cache LRU : {field}", [({"cache": name}, s[field]) for name, s in stats.items()])
+    return gauges
+
+def gazetteer_gauges():
+    from back import phrase_controller
+    stats = phrase_controller.gazetteer.stats()
+    return {
+        "gazetteer_hits": ("Phrases résolues par le gazetteer (sans NER)", [({}, stats["hits"])]),
+        "gazetteer_fallbacks": ("Phrases renvoyées au NER", [({}, stats["fallbacks"])]),
+        "gazetteer_hit_rate": ("Part des phrases résolues par le gazetteer", [({}, stats["hit_rate"])]),
+    }
+
+def snapshot():
+    """Quantiles courants en dict python (ex : pour les logs ou les benchmarks)."""
+    with _lock:
+        return {
+            metric: {label: {"count": s.count, "sum": s.sum, **{f"p{int(q * 100)}": v for q, v in s.quantiles().items()}}
+                     for label, s in series.items()}
+            for metric, (_, series) in _metrics.items()
+        }
+
+def register_metrics(server):
+    @server.get("/metrics")
+    def metrics_endpoint():
+        return Response(render({**cache_gauges(), **gazetteer_gauges()}), mimetype="text/plain; version=0.0.4")
+    return server
@@ -1,3 +1,4 @@
+import math
 import os
 import sys
 
@@ -5,11 +6,18 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.append(parent_dir)
 
-from back.dataframe import df
+from back import dataframe, snapshot
+from back.dataframe import cache_dir
 
 import numpy as np
-from heapq import heappush, heappop
+import threading
+from heapq import heappush, heappop, heapify
 import pandas as pd
+from pathlib import Path
+
+
+ROUTING_METHOD = os.getenv("routing_method", "dijkstra")  # methode par defaut de shortest_path
+GRAPH_VERSION = 3  # a incrementer si la construction du graphe change (invalide le cache)
 
 
 def hms_to_seconds(hms: str) -> int:
@@ -18,69 +26,441 @@ def hms_to_seconds(hms: str) -> int:
     h, m, s = map(int, str(hms).split(":"))
     return h * 3600 + m * 60 + s
 
+def hms_to_seconds_array(values) -> np.ndarray:
+    """Version vectorisee de hms_to_seconds : float64, NaN si la valeur est manquante."""
+    parts = pd.Series(values).astype("string").str.split(":", n=2, expand=True)
+    if parts.shape[1] < 3:
+        return np.full(len(parts), np.nan)
+    h, m, s = (pd.to_numeric(parts[i], errors="coerce").to_numpy(dtype="float64", na_value=np.nan) for i in range(3))
+    return h * 3600 + m * 60 + s
+
 def normalize_times_per_trip(df: pd.DataFrame, time_col: str) -> pd.Series:
-    out = pd.Series(index=df.index, dtype="float64")
-
-    for trip_id, g in df.groupby("trip_id", sort=False):
-        g = g.sort_values("stop_sequence")
-        base = g[time_col].apply(hms_to_seconds)
-
-        offset = 0
-        last = None
-        norm = []
-        for t in base:
-            if t is None:
-                norm.append(np.nan)
-                continue
-            if last is not None and t + offset < last:
-                offset += 24 * 3600
-            tt = t + offset
-            norm.append(tt)
-            last = tt
+    """Secondes depuis minuit, +24h a chaque fois que l'heure recule dans un trip (passage de minuit)."""
+    order = np.lexsort((df["stop_sequence"].to_numpy(), pd.factorize(df["trip_id"])[0]))
+    t = hms_to_seconds_array(df[time_col].to_numpy()[order])
+    trips = pd.factorize(df["trip_id"].to_numpy()[order])[0]
 
-        out.loc[g.index] = norm
+    valid = ~np.isnan(t)
+    tv, trv = t[valid], trips[valid]
+    same_trip = trv[1:] == trv[:-1]
+    rollover = same_trip & (tv[1:] < tv[:-1])
+    count = np.concatenate(([0], np.cumsum(rollover)))
+    # nombre de passages de minuit depuis le debut du trip
+    group_start = np.maximum.accumulate(np.where(np.concatenate(([True], ~same_trip)), np.arange(len(tv)), 0))
+    t[valid] = tv + (count - count[group_start]) * 24 * 3600
 
-    return out
+    out = np.empty(len(t))
+    out[order] = t
+    return pd.Series(out, index=df.index, dtype="float64")
 
+def build_edges(df: pd.DataFrame) -> pd.DataFrame:
+    """1 arc par trip_id = (origin -> destination)
+    origin = 1er stop du trip, destination = dernier stop du trip
+    poids = arr(last) - dep(first)
+    La colonne trip_id est gardee (reconstruction incrementale, cf. hot_reload).
+    """
+    g = df.dropna(subset=[NODE_COL]).groupby("trip_id", sort=False, observed=True)
+
+    edges = pd.DataFrame({
+        "u": g[NODE_COL].first(),
+        "v": g[NODE_COL].last(),
+        "dep_u": g["dep_s_norm"].first(),
+        "arr_v": g["arr_s_norm"].last(),
+    }).reset_index()
+
+    edges["w"] = edges["arr_v"] - edges["dep_u"]
+    edges = edges.dropna(subset=["u", "v", "w"])
+    edges = edges[edges["w"] > 0]  # garder durées positives
+    return edges
+
+def best_edges_from(edges: pd.DataFrame) -> pd.DataFrame:
+    # garder le meilleur temps par OD
+    best_edges = edges.groupby(["u", "v"], as_index=False, observed=True)["w"].min()
+    best_edges["w"] = best_edges["w"].astype(int)
+    return best_edges
+
+def graph_cache_path(digest=None) -> Path:
+    return cache_dir / f"graph_{digest or snapshot.current().version}_{NODE_COL}_v{GRAPH_VERSION}.npz"
+
+def trip_edges_from(edges: pd.DataFrame) -> pd.DataFrame:
+    """Arc (u, v, w) de chaque trip, avant le minimum par OD."""
+    return pd.DataFrame({
+        "trip_id": edges["trip_id"].astype(str).to_numpy(dtype=object),
+        "u": edges["u"].to_numpy(dtype=object),
+        "v": edges["v"].to_numpy(dtype=object),
+        "w": edges["w"].to_numpy(dtype="float64"),
+    })
+
+def save_graph_cache(path, df, best_edges, trip_edges):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(
+        tmp,
+        dep_s_norm=df["dep_s_norm"].to_numpy(),
+        arr_s_norm=df["arr_s_norm"].to_numpy(),
+        u=np.asarray(best_edges["u"].tolist()),
+        v=np.asarray(best_edges["v"].tolist()),
+        w=best_edges["w"].to_numpy(dtype=np.int64),
+        trip_id=np.asarray(trip_edges["trip_id"].tolist(), dtype=str),
+        trip_u=np.asarray(trip_edges["u"].tolist()),
+        trip_v=np.asarray(trip_edges["v"].tolist()),
+        trip_w=trip_edges["w"].to_numpy(dtype="float64"),
+    )
+    os.replace(tmp, path)
+
+def load_or_build_graph(df: pd.DataFrame, digest=None):
+    """Colonnes dep/arr normalisees, meilleurs arcs OD et arcs par trip,
+    relus depuis le cache npz si le csv n'a pas change."""
+    path = graph_cache_path(digest)
+    if path.exists():
+        with np.load(path, allow_pickle=False) as data:
+            df["dep_s_norm"] = data["dep_s_norm"]
+            df["arr_s_norm"] = data["arr_s_norm"]
+            best_edges = pd.DataFrame({"u": data["u"].tolist(), "v": data["v"].tolist(), "w": data["w"].astype(int)})
+            trip_edges = pd.DataFrame({"trip_id": data["trip_id"].tolist(), "u": data["trip_u"].tolist(),
+                                       "v": data["trip_v"].tolist(), "w": data["trip_w"]})
+        print("graph loaded from cache", path)
+        return df, best_edges, trip_edges
+
+    # Normaliser arrival/departure (gestion minuit)
+    df["dep_s_norm"] = normalize_times_per_trip(df, "departure_time")
+    df["arr_s_norm"] = normalize_times_per_trip(df, "arrival_time")
+    trip_edges = trip_edges_from(build_edges(df))
+    best_edges = best_edges_from(trip_edges)
+    save_graph_cache(path, df, best_edges, trip_edges)
+    return df, best_edges, trip_edges
+
+def adjacency(best_edges):
+    """dict d'adjacence (implementation de reference, cf. dijkstra_adj)"""
+    adj = {}
+    for u, v, w in best_edges[["u", "v", "w"]].itertuples(index=False):
+        adj.setdefault(u, []).append((v, w))
+    return adj
+
+
+NODE_COL = "parent_station" if "parent_station" in dataframe.df.columns else "stop_id"
+_adj = (None, None)  # (best_edges source, dict) : construit au premier appel de dijkstra_adj
+
+
+EARTH_RADIUS_M = 6371000.0
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distance a vol d'oiseau en metres (coordonnees en radians, scalaires ou tableaux)."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def node_coordinates(df):
+    """Position (stop_lat, stop_lon) de chaque gare, premiere ligne du df."""
+    if not {"stop_lat", "stop_lon"} <= set(df.columns):
+        return None
+    return df.dropna(subset=[NODE_COL]).groupby(NODE_COL, sort=False, observed=True)[["stop_lat", "stop_lon"]].first()
+
+
+class Graph:
+    """Graphe en CSR : ids de gares internés en entiers denses 0..n-1.
+
+    Les arcs sortants du noeud i sont indices[indptr[i]:indptr[i+1]], de poids weights[...].
+    """
+
+    def __init__(self, nodes, indptr, indices, weights, coords=None):
+        self.nodes = np.asarray(nodes, dtype=object)
+        self.node_index = {node: i for i, node in enumerate(self.nodes.tolist())}
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self._reverse = None
+        self._views = None
+        self._coord_views = None
+        self.version = None  # empreinte des donnees sources (invalidation des caches)
+        self.set_coordinates(coords)
+
+    @classmethod
+    def from_edges(cls, best_edges, coords=None):
+        codes, nodes = pd.factorize(pd.concat([best_edges["u"], best_edges["v"]], ignore_index=True))
+        m = len(best_edges)
+        return cls.from_arrays(np.asarray(nodes, dtype=object), codes[:m], codes[m:], best_edges["w"].to_numpy(), coords)
+
+    @classmethod
+    def from_arrays(cls, nodes, u, v, w, coords=None):
+        order = np.lexsort((v, u))
+        u, v, w = u[order], v[order], w[order]
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(u, minlength=len(nodes)), out=indptr[1:])
+        return cls(nodes, indptr, v.astype(np.int32), w.astype(np.int32), coords)
+
+    def set_coordinates(self, coords):
+        """coords : DataFrame indexe par id de gare (stop_lat, stop_lon), pour l'heuristique A*.
+
+        max_speed (m/s) est la plus grande vitesse a vol d'oiseau observee sur un arc :
+        distance / max_speed ne surestime donc jamais un temps de trajet.
+        """
+        self.lat = self.lon = None
+        self.max_speed = None
+        self._coord_views = None
+        if coords is None:
+            return
+        coords = coords.reindex(self.nodes)
+        lat = np.radians(coords["stop_lat"].to_numpy(dtype="float64"))
+        lon = np.radians(coords["stop_lon"].to_numpy(dtype="float64"))
+        if np.isnan(lat).any() or np.isnan(lon).any():
+            return  # heuristique incoherente si des gares n'ont pas de position
+        self.lat, self.lon = lat, lon
+        u, v, w = self.edges()
+        speeds = haversine_m(lat[u], lon[u], lat[v], lon[v]) / np.maximum(w, 1)
+        self.max_speed = float(speeds.max()) if len(speeds) else 0.0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def edges(self):
+        """Tableaux (u, v, w) des arcs."""
+        u = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.indptr))
+        return u, self.indices, self.weights
+
+    @property
+    def views(self):
+        """(indptr, indices, weights) en listes python pour la boucle de recherche :
+        l'acces element par element y est bien plus rapide que sur un tableau numpy."""
+        if self._views is None:
+            self._views = (self.indptr.tolist(), self.indices.tolist(), self.weights.tolist())
+        return self._views
+
+    @property
+    def coord_views(self):
+        """(lat, lon, cos(lat)) en listes python : potentiels A* calcules noeud par noeud."""
+        if self._coord_views is None:
+            self._coord_views = (self.lat.tolist(), self.lon.tolist(), np.cos(self.lat).tolist())
+        return self._coord_views
+
+    def reverse(self):
+        """Graphe transposé (construit une fois, à la demande)."""
+        if self._reverse is None:
+            u, v, w = self.edges()
+            self._reverse = Graph.from_arrays(self.nodes, v, u, w)
+            self._reverse.lat, self._reverse.lon, self._reverse.max_speed = self.lat, self.lon, self.max_speed
+        return self._reverse
+
+
+class _SearchBuffers:
+    """Tableaux distance / predecesseur / racine preallouees, remis a zero uniquement sur les noeuds touches."""
+
+    def __init__(self, graph):
+        n = len(graph)
+        self.graph = graph
+        self.dist = [np.inf] * n
+        self.pred = [-1] * n
+        self.root = [-1] * n
+        self.views = (self.dist, self.pred, self.root)
+        self.touched = []
+
+    def reset(self):
+        dist, pred, root = self.views
+        for i in self.touched:
+            dist[i] = np.inf
+            pred[i] = -1
+            root[i] = -1
+        self.touched.clear()
+
+    def path_to(self, t):
+        path = [t]
+        pred = self.pred
+        while pred[path[-1]] >= 0:
+            path.append(pred[path[-1]])
+        path.reverse()
+        return path
+
+
+_local = threading.local()
+
+def _buffers(graph):
+    # un jeu de tampons par thread (requetes concurrentes) et par graphe
+    buf = getattr(_local, "buffers", None)
+    if buf is None or buf.graph is not graph:
+        buf = _local.buffers = _SearchBuffers(graph)
+    return buf
+
+
+def _search(graph, seeds, targets=None, k=1, budget=np.inf, detour=None, stats=None):
+    """Coeur de Dijkstra sur les tableaux CSR (indices entiers).
+
+    seeds : [(cout initial, noeud)], targets : dict noeud -> penalite ou None (one-to-all).
+    S'arrete quand les k meilleures cibles (ou toutes les cibles) sont fixees ou quand la distance depasse budget.
+    detour : au lieu de s'arreter sur les cibles, continue jusqu'a detour x le cout de la premiere fixee.
+    Retourne (buffers, found) ; l'appelant doit appeler buffers.reset().
+    """
+    buf = _buffers(graph)
+    if targets is not None:
+        if not targets:
+            return buf, []
+        k = min(k, len(targets))  # moins de cibles que k : arret quand toutes sont fixees
+    stop_on_targets = targets is not None and detour is None
+    dist, pred, root = buf.views
+    indptr, indices, weights = graph.views
+    touched = buf.touched
+    inf = np.inf
+
+    heap = []
+    for c, s in seeds:
+        if c < dist[s]:
+            if dist[s] == inf:
+                touched.append(s)
+            dist[s] = c
+            root[s] = s
+            heap.append((c, s))
+    heapify(heap)
+
+    found = []
+    settled = 0
+    while heap:
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue  # entree perimee
+        if d > budget:
+            break
+        if stop_on_targets and len(found) >= k and d >= found[k - 1][0]:
+            break  # les penalites d'arrivee sont >= 0 : plus rien de meilleur
+        settled += 1
+        if targets is not None and u in targets:
+            found.append((d + targets[u], u))
+            found.sort()
+            if not stop_on_targets:
+                budget = min(budget, found[0][0] * detour)
+            elif len(found) == len(targets):
+                break  # toutes les cibles sont fixees
+        a, b = indptr[u], indptr[u + 1]
+        for v, w in zip(indices[a:b], weights[a:b]):
+            nd = d + w
+            if nd < dist[v]:
+                if dist[v] == inf:
+                    touched.append(v)
+                dist[v] = nd
+                pred[v] = u
+                root[v] = root[u]
+                heappush(heap, (nd, v))
+
+    if stats is not None:
+        stats["settled"] = stats.get("settled", 0) + settled
+    return buf, found
 
-# PREP
-NODE_COL = "parent_station" if "parent_station" in df.columns else "stop_id"
-df = df.sort_values(["trip_id", "stop_sequence"]).reset_index(drop=True)
-
-# Normaliser arrival/departure (gestion minuit)
-df["dep_s_norm"] = normalize_times_per_trip(df, "departure_time")
-df["arr_s_norm"] = normalize_times_per_trip(df, "arrival_time")
-
-# -----------------------
-# NOUVEAU : 1 arc par trip_id = (origin -> destination)
-# origin = 1er stop du trip
-# destination = dernier stop du trip
-# poids = arr(last) - dep(first)
-# -----------------------
-g = df.dropna(subset=[NODE_COL]).groupby("trip_id", sort=False)
-
-edges = pd.DataFrame({
-    "u": g[NODE_COL].first(),
-    "v": g[NODE_COL].last(),
-    "dep_u": g["dep_s_norm"].first(),
-    "arr_v": g["arr_s_norm"].last(),
-}).reset_index(drop=True)
-
-edges["w"] = edges["arr_v"] - edges["dep_u"]
-edges = edges.dropna(subset=["u", "v", "w"])
-edges = edges[edges["w"] > 0]  # garder durées positives
-
-# garder le meilleur temps par OD
-best_edges = edges.groupby(["u", "v"], as_index=False)["w"].min()
-best_edges["w"] = best_edges["w"].astype(int)
-
-# dict d'adjacence
-adj = {}
-for u, v, w in best_edges.itertuples(index=False):
-    adj.setdefault(u, []).append((v, w))
 
 # Dijkstra
-def dijkstra( start, goal):
+def dijkstra(start, goal, stats=None):
+    g = snapshot.current().graph
+    s, t = g.node_index.get(start), g.node_index.get(goal)
+    if s is None or t is None:
+        return ([start], 0) if start == goal else (None, np.inf)
+
+    buf, found = _search(g, [(0, s)], {t: 0}, stats=stats)
+    try:
+        if not found:
+            return None, np.inf
+        return g.nodes[buf.path_to(t)].tolist(), int(buf.dist[t])
+    finally:
+        buf.reset()
+
+def shortest_path(start, goal, method=None, stats=None):
+    """Plus court chemin avec la methode choisie : "dijkstra", "astar" (A* bidirectionnel)
+    "ch" (contraction hierarchies) ou "matrix" (matrice precalculee, cf. all_pairs).
+    Les durees sont identiques quelle que soit la methode."""
+    method = method or ROUTING_METHOD
+    if method == "dijkstra":
+        return dijkstra(start, goal, stats=stats)
+    if method == "astar":
+        return bidirectional_astar(start, goal, stats=stats)
+    if method == "ch":
+        from back import contraction
+        return contraction.query(start, goal, stats=stats)
+    if method == "matrix":
+        from back import all_pairs
+        return all_pairs.query(start, goal, stats=stats)
+    raise ValueError(f"methode de routage inconnue : {method}")
+
+# A* bidirectionnel
+def _potential(g, s, t):
+    """Fonction v -> (h_goal(v) - h_start(v)) / 2, haversine_m en flottants python :
+    evaluee seulement sur les noeuds que la recherche atteint, pas sur tout le graphe."""
+    if g.lat is None or not g.max_speed:
+        return lambda v: 0.0
+    lat, lon, cos = g.coord_views
+    sin, asin, sqrt = math.sin, math.asin, math.sqrt
+    lat_s, lon_s, cos_s = lat[s], lon[s], cos[s]
+    lat_t, lon_t, cos_t = lat[t], lon[t], cos[t]
+    k = EARTH_RADIUS_M / g.max_speed  # 2 * R / max_speed, divise par 2 (potentiel moyen)
+
+    def potential(v):
+        la, lo, c = lat[v], lon[v], cos[v]
+        a_t = sin((lat_t - la) / 2) ** 2 + c * cos_t * sin((lon_t - lo) / 2) ** 2
+        a_s = sin((lat_s - la) / 2) ** 2 + c * cos_s * sin((lon_s - lo) / 2) ** 2
+        return k * (asin(sqrt(min(a_t, 1.0))) - asin(sqrt(min(a_s, 1.0))))
+    return potential
+
+def bidirectional_astar(start, goal, stats=None):
+    """A* bidirectionnel guide par la distance a vol d'oiseau / max_speed.
+
+    Potentiels moyens p(v) = (h_goal(v) - h_start(v)) / 2 : coherents dans les deux sens,
+    donc meme duree que dijkstra. Sans coordonnees, se comporte comme un Dijkstra bidirectionnel.
+    """
+    g = snapshot.current().graph
+    s, t = g.node_index.get(start), g.node_index.get(goal)
+    if s is None or t is None:
+        return ([start], 0) if start == goal else (None, np.inf)
+
+    potential = _potential(g, s, t)
+    pot = {s: potential(s), t: potential(t)}  # potentiels des noeuds deja atteints (cette requete)
+    views = (g.views, g.reverse().views)
+    sign = (1, -1)
+    dist = ({s: 0}, {t: 0})
+    pred = ({s: -1}, {t: -1})
+    heaps = ([(pot[s], 0, s)], [(-pot[t], 0, t)])
+    best, meet = (0, s) if s == t else (np.inf, -1)
+    settled = 0
+    inf = math.inf
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        _, d, u = heappop(heaps[side])
+        if d > dist[side][u]:
+            continue
+        settled += 1
+        this, other, back, p = dist[side], dist[1 - side], pred[side], sign[side]
+        indptr, indices, weights = views[side]
+        a, b = indptr[u], indptr[u + 1]
+        for v, w in zip(indices[a:b], weights[a:b]):
+            nd = d + w
+            if nd < this.get(v, inf):
+                this[v] = nd
+                back[v] = u
+                pv = pot.get(v)
+                if pv is None:
+                    pv = pot[v] = potential(v)
+                heappush(heaps[side], (nd + p * pv, nd, v))
+                if v in other and nd + other[v] < best:
+                    best, meet = nd + other[v], v
+
+    if stats is not None:
+        stats["settled"] = stats.get("settled", 0) + settled
+    if meet < 0:
+        return None, np.inf
+
+    path = [meet]
+    while pred[0][path[-1]] >= 0:
+        path.append(pred[0][path[-1]])
+    path.reverse()
+    v = meet
+    while pred[1][v] >= 0:
+        v = pred[1][v]
+        path.append(v)
+    return g.nodes[path].tolist(), int(best)
+
+def dijkstra_adj(start, goal):
+    """Ancienne implementation sur le dict d'adjacence, gardee comme reference (benchmarks)."""
+    global _adj
+    best_edges, adj = _adj
+    if best_edges is not snapshot.current().best_edges:  # inutile au service, lourd en objets python
+        best_edges = snapshot.current().best_edges
+        adj = adjacency(best_edges)
+        _adj = (best_edges, adj)
     dist = {start: 0}
     prev = {}
     heap = [(0, start)]
@@ -107,3 +487,171 @@ def dijkstra( start, goal):
     path.reverse()
     return path, dist[goal]
 
+
+# Recherche bornee one-to-all (isochrones)
+def reachable(start, budget, stats=None):
+    """Gares atteignables depuis start en au plus budget secondes.
+
+    Dijkstra one-to-all arrete des que la distance fixee depasse budget : seules les
+    gares dans le budget (et leurs voisines) sont explorees. Retourne deux tableaux
+    (ids, durees en s) tries par duree, start compris.
+    """
+    g = snapshot.current().graph
+    s = g.node_index.get(start)
+    if s is None:
+        return np.array([start], dtype=object), np.zeros(1, dtype=np.int64)
+
+    buf, _ = _search(g, [(0, s)], budget=budget, stats=stats)
+    try:
+        nodes = np.array(buf.touched, dtype=np.int64)
+        dist = np.array([buf.dist[i] for i in buf.touched], dtype="float64")
+    finally:
+        buf.reset()
+    keep = dist <= budget
+    nodes, dist = nodes[keep], dist[keep]
+    order = np.argsort(dist, kind="stable")
+    return g.nodes[nodes[order]], dist[order].astype(np.int64)
+
+
+# K plus courts chemins sans boucle (Yen)
+MAX_DETOUR = 1.5  # une alternative ne doit pas durer plus de MAX_DETOUR x le meilleur trajet
+
+def _edge_weight(views, u, v):
+    indptr, indices, weights = views
+    a, b = indptr[u], indptr[u + 1]
+    return min(w for x, w in zip(indices[a:b], weights[a:b]) if x == v)
+
+def _spur_search(g, spur, t, h, banned_nodes, banned_edges, budget, stats):
+    """A* de spur vers t, guide par h = distance exacte a t dans le graphe complet
+    (arbre des plus courts chemins inverse) : admissible meme avec des arcs retires."""
+    indptr, indices, weights = g.views
+    dist = {spur: 0}
+    pred = {spur: -1}
+    heap = [(h[spur], 0, spur)]
+    settled = 0
+    while heap:
+        f, d, u = heappop(heap)
+        if d > dist[u]:
+            continue
+        if f > budget:
+            break
+        settled += 1
+        if u == t:
+            break
+        a, b = indptr[u], indptr[u + 1]
+        for v, w in zip(indices[a:b], weights[a:b]):
+            if v in banned_nodes or v not in h or (u, v) in banned_edges:
+                continue
+            nd = d + w
+            if nd < dist.get(v, np.inf):
+                dist[v] = nd
+                pred[v] = u
+                heappush(heap, (nd + h[v], nd, v))
+    if stats is not None:
+        stats["settled"] = stats.get("settled", 0) + settled
+    if t not in dist or dist[t] > budget:
+        return None, np.inf
+    path = [t]
+    while pred[path[-1]] >= 0:
+        path.append(pred[path[-1]])
+    path.reverse()
+    return path, dist[t]
+
+def k_shortest_paths(start, goal, k=3, max_detour=MAX_DETOUR, stats=None):
+    """Jusqu'a k chemins sans boucle de start a goal, tries par duree : [(path, total_s)].
+
+    Algorithme de Yen. L'arbre des plus courts chemins vers goal (une recherche sur le
+    graphe transpose, arretee a max_detour x la distance de start) est calcule une fois :
+    il donne le premier chemin et sert d'heuristique exacte aux recherches de deviation,
+    qui ne fixent alors que peu de gares.
+    Les chemins plus longs que max_detour x le meilleur sont ignores.
+    """
+    g = snapshot.current().graph
+    s, t = g.node_index.get(start), g.node_index.get(goal)
+    if s is None or t is None:
+        return [([start], 0)] if start == goal else []
+
+    # les gares a plus de limit de goal ne peuvent etre sur aucun chemin retenu
+    buf, found = _search(g.reverse(), [(0, t)], {s: 0}, detour=max_detour, stats=stats)
+    try:
+        if not found:
+            return []
+        limit = found[0][0] * max_detour
+        dist, pred = buf.dist, buf.pred
+        h = {v: dist[v] for v in buf.touched if dist[v] <= limit}
+        succ = {v: pred[v] for v in h}  # gare suivante vers goal
+    finally:
+        buf.reset()
+
+    path = [s]
+    while path[-1] != t:
+        path.append(succ[path[-1]])
+    views = g.views
+    accepted = [(h[s], path)]
+    candidates, seen = [], {tuple(path)}
+    while len(accepted) < k:
+        _, last = accepted[-1]
+        root_cost = 0
+        for j in range(len(last) - 1):
+            spur, root = last[j], last[:j + 1]
+            banned_edges = {(p[j], p[j + 1]) for _, p in accepted if p[:j + 1] == root}
+            spur_path, spur_cost = _spur_search(g, spur, t, h, set(root[:-1]), banned_edges, limit - root_cost, stats)
+            if spur_path is not None:
+                full = root[:-1] + spur_path
+                if tuple(full) not in seen:
+                    seen.add(tuple(full))
+                    heappush(candidates, (root_cost + spur_cost, full))
+            root_cost += _edge_weight(views, last[j], last[j + 1])
+        if not candidates:
+            break
+        accepted.append(heappop(candidates))
+    return [(g.nodes[p].tolist(), int(cost)) for cost, p in accepted]
+
+
+# Dijkstra multi-sources / multi-cibles
+def multi_source_dijkstra(sources, targets, k=1, stats=None):
+    """Une seule recherche depuis toutes les sources vers toutes les cibles.
+
+    sources / targets : dict id -> cout initial en secondes (penalite de correspondance).
+    Retourne jusqu'a k resultats (cout, source, cible, path, total_s) tries par cout,
+    au plus un par cible ; total_s est le temps de trajet sans les penalites.
+    """
+    g = snapshot.current().graph
+    seeds = [(c, g.node_index[s]) for s, c in sources.items() if s in g.node_index]
+    goals = {g.node_index[t]: c for t, c in targets.items() if t in g.node_index}
+
+    buf, found = _search(g, seeds, goals, k=k, stats=stats)
+    try:
+        results = []
+        for cost, t in found[:k]:
+            path = g.nodes[buf.path_to(t)].tolist()
+            results.append((cost, path[0], path[-1], path, int(round(buf.dist[t] - sources[path[0]]))))
+    finally:
+        buf.reset()
+
+    # gare isolee (absente du graphe) a la fois depart et arrivee candidate
+    for id_ in sources.keys() & targets.keys():
+        if id_ not in g.node_index:
+            results.append((sources[id_] + targets[id_], id_, id_, [id_], 0))
+    results.sort(key=lambda r: r[0])
+    return results[:k]
+
+
+# PREP
+def __getattr__(name):
+    # etat de la base courante (cf. snapshot), remplace d'un bloc par hot_reload
+    if name in ("df", "trip_edges", "best_edges", "graph"):
+        return getattr(snapshot.current(), name)
+    if name == "database_digest":
+        return snapshot.current().version
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _initial_state():
+    digest = dataframe.database_digest
+    df = dataframe.df.sort_values(["trip_id", "stop_sequence"]).reset_index(drop=True)
+    df, best_edges, trip_edges = load_or_build_graph(df, digest)
+    graph = Graph.from_edges(best_edges, node_coordinates(df))
+    graph.version = digest
+    return dict(version=digest, path=dataframe.path_to_database, df=df, trip_edges=trip_edges, best_edges=best_edges, graph=graph)
+
+snapshot.extend(**_initial_state())
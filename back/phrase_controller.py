@@ -1,95 +1,127 @@
 import os
 import sys
-import re
-import unicodedata
-from rapidfuzz import fuzz
+import numpy as np
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.append(parent_dir)
 
 
-from back import extract_gares 
-from back.stations import get_station_candidates_by_raw_name, get_station_id_by_name
-from back.path_finding import dijkstra
-
-
-BAD_TOKENS = {"rue", "route", "eglise", "église", "avenue", "bd", "boulevard"}
-GOOD_TOKENS = {"gare", "centre", "ville"}
-def normalize(s: str) -> str:
-    s = s.strip().lower()
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(c for c in s if unicodedata.category(c) != "Mn")  # remove accents
-    s = re.sub(r"[-'’]", " ", s)
-    s = re.sub(r"[^a-z0-9\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-def best_station_match(query: str, candidates: list[str]) -> tuple[str, float]:
-    q = normalize(query)
-
-    # 1) exact match wins
-    exact = [c for c in candidates if normalize(c) == q]
-    if exact:
-        return [exact[0]], [1.0]
-
-    q_tokens = q.split()
-
-    best = None
-    best_score = -1.0
-    cand_list = []
-    scores_list = []
-    for cand in candidates:
-        c_norm = normalize(cand)
-        c_tokens = c_norm.split()
-
-        # base fuzzy similarity
-        score = fuzz.WRatio(q, c_norm) / 100.0
-        print(cand, score)
-        # 2) word-boundary bonus (metz as a full token)
-        if q in c_tokens:
-            score += 0.20
-
-        # 3) prefix trap penalty (metz vs metzeral/metzing/metzervisse...)
-        # if query is a prefix of first token but not a full token => penalize hard
-        if c_tokens and c_tokens[0].startswith(q) and q not in c_tokens:
-            score -= 0.35
-
-        # 4) heuristic tokens
-        if any(t in c_tokens for t in GOOD_TOKENS):
-            score += 0.05
-        if any(t in c_tokens for t in BAD_TOKENS):
-            score -= 0.05
-
-        if score > best_score:
-            best_score = score
-            best = cand
-        cand_list.append(cand)
-        scores_list.append(score)
-    return cand_list, scores_list
+from back import extract_gares, metrics, path_finding, snapshot, stations
+from back.matching import StationMatcher
+from back.path_finding import multi_source_dijkstra, shortest_path, k_shortest_paths, reachable
+from back.cache import LRUCache
+from back.gazetteer import Gazetteer
+
+
+# matcher et gazetteer (formes simples « de X à Y » resolues sans le NER) : dans le snapshot,
+# remplaces avec le registre par hot_reload ; toujours passer par le module (phrase_controller.matcher...)
+snapshot.extend(matcher=StationMatcher(stations.registry.index_by_name),
+                gazetteer=Gazetteer(stations.registry.index_by_name))
+
+def __getattr__(name):
+    if name in ("matcher", "gazetteer"):
+        return getattr(snapshot.current(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+SCORE_PENALTY_S = 1800  # secondes ajoutees par point de score de correspondance perdu
+MAX_ALTERNATIVES = 3
+MAX_ROUTES = 3  # itineraires proposes (meilleur + alternatives) entre les gares retenues
+
+# caches : phrase -> (depart, arrivee) bruts, nom brut -> candidats classes, OD -> chemin
+# (chaque entree est marquee de la version sur laquelle elle a ete calculee, cf. LRUCache)
+phrase_cache = LRUCache("phrase", maxsize=4096, ttl=24 * 3600, version=extract_gares.model_version)
+candidates_cache = LRUCache("candidates", maxsize=4096, version=lambda: stations.registry.version)
+route_cache = LRUCache("route", maxsize=8192, version=lambda: path_finding.graph.version)
+
+
+def best_station_match(query: str, candidates: list[str]) -> tuple[list[str], list[float]]:
+    matcher = snapshot.current().matcher
+    return matcher.match(query, matcher.positions(candidates))
+
+def cache_stats():
+    return {c.name: c.stats() for c in (phrase_cache, candidates_cache, route_cache)}
+
+def fast_path(phrase):
+    """Départ / arrivée trouvés par le gazetteer (sans NER), ou None si la phrase est ambiguë."""
+    with metrics.span("gazetteer"):
+        found = snapshot.current().gazetteer.resolve(phrase)
+    if found is None:
+        return None
+    return {
+        "raw_input_depart":found['depart'],
+        "raw_input_arrivee":found['arrivee'],
+        "extraction":"gazetteer",
+        "extraction_confidence":found['confidence'],
+    }
 
 def extract_stations_from_phrase(phrase):
-    stations_dict = extract_gares.extract_stations(phrase)
+    stations_dict = fast_path(phrase)
+    if stations_dict is None:
+        key = " ".join(str(phrase).lower().split())
+        stations_dict = phrase_cache.get_or_compute(key, lambda: extract_gares.extract_stations(phrase))
+    return trip_info_from_stations(stations_dict)
+
+def ranked_candidates(raw_name):
+    """(noms, scores, ids) des meilleures gares pour un nom brut, ou None si aucune gare ne correspond."""
+    def compute():
+        registry = stations.registry
+        with metrics.span("candidates"):
+            _, names = registry.candidates(raw_name)
+        metrics.observe("candidates", len(names), "substring")
+        if not names:
+            return None
+        with metrics.span("matching"):
+            names, scores = best_station_match(raw_name, names)
+        metrics.observe("candidates", len(names), "ranked")
+        return names, scores, [registry.id_by_name[n] for n in names]
+    with snapshot.pinned():
+        return candidates_cache.get_or_compute(str(raw_name).strip().lower(), compute)
+
+def _timed_search(stage, search, *args, **kwargs):
+    stats = {}
+    with metrics.span(stage):
+        result = search(*args, stats=stats, **kwargs)
+    metrics.observe("settled_nodes", stats.get("settled", 0), stage)
+    return result
+
+def cached_shortest_path(start, goal, method=None):
+    with snapshot.pinned():
+        return route_cache.get_or_compute(("pair", start, goal, method), lambda: _timed_search("shortest_path", shortest_path, start, goal, method=method))
+
+def cached_multi_source_dijkstra(sources, targets, k=1):
+    key = ("multi", tuple(sorted(sources.items())), tuple(sorted(targets.items())), k)
+    with snapshot.pinned():
+        return route_cache.get_or_compute(key, lambda: _timed_search("multi_source_dijkstra", multi_source_dijkstra, sources, targets, k=k))
+
+def cached_k_shortest_paths(start, goal, k=MAX_ROUTES):
+    with snapshot.pinned():
+        return route_cache.get_or_compute(("ksp", start, goal, k), lambda: _timed_search("k_shortest_paths", k_shortest_paths, start, goal, k=k))
+
+def cached_reachable(start, budget):
+    """(ids, durées) des gares atteignables depuis start en au plus budget secondes ;
+    lus dans la matrice all_pairs si elle est construite, sinon recherche bornée."""
+    def compute():
+        from back import all_pairs
+        matrix = all_pairs.current()
+        if matrix is None:
+            return _timed_search("reachable", reachable, start, budget)
+        with metrics.span("reachable_matrix"):
+            return matrix.reachable_within(start, budget)
+    with snapshot.pinned():
+        return route_cache.get_or_compute(("reach", start, int(budget)), compute)
+
+def trip_info_from_stations(stations_dict):
     if type(stations_dict) == str:
         return stations_dict
 
-    candidates_arrivee = get_station_candidates_by_raw_name(stations_dict['raw_input_arrivee'])
-    if candidates_arrivee == ([],[]):
+    gare_arrivee = ranked_candidates(stations_dict['raw_input_arrivee'])
+    if gare_arrivee is None:
         return "La gare d'arrivée n'est pas valide"
-    candidates_depart = get_station_candidates_by_raw_name(stations_dict['raw_input_depart'])
-    if candidates_depart == ([],[]):
+    gare_depart = ranked_candidates(stations_dict['raw_input_depart'])
+    if gare_depart is None:
         return "La gare de départ n'est pas valide"
-    
-    gare_arrivee = best_station_match(stations_dict['raw_input_arrivee'], candidates_arrivee[1])
-    id_arrivee = []
-    for g in gare_arrivee[0]:
-        id_arrivee.append(get_station_id_by_name(g))
-    
-    
-    gare_depart = best_station_match(stations_dict['raw_input_depart'], candidates_depart[1])
-    id_depart = []
-    for g in gare_depart[0]:
-        id_depart.append(get_station_id_by_name(g))
+    id_arrivee, id_depart = gare_arrivee[2], gare_depart[2]
 
     trip_information = {
         "raw_input_depart":stations_dict['raw_input_depart'],
@@ -100,39 +132,101 @@ def extract_stations_from_phrase(phrase):
         "list_match_score_depart":gare_depart[1],
         "list_id_gare_arrivee":id_arrivee,
         "list_id_gare_depart":id_depart,
+        "extraction":stations_dict.get('extraction', "ner"),
+        "extraction_confidence":stations_dict.get('extraction_confidence'),
     }
     return trip_information
 
-def phrase_to_trip(raw_phrase):
-    #1. normalize phrase
-    phrase = str(raw_phrase).lower()
-
-    trip_info = extract_stations_from_phrase(phrase)
-    print(trip_info)
-    if type(trip_info) == str:
-        return trip_info
-
-    #find best trip
-    trips_dict = {}
-    for d_name, d_id, d_score in zip(trip_info['list_gare_depart'],trip_info['list_id_gare_depart'],trip_info['list_match_score_depart']) :
-        for a_name, a_id, a_score in zip(trip_info['list_gare_arrivee'],trip_info['list_id_gare_arrivee'],trip_info['list_match_score_arrivee']) :
-            path, total_s = dijkstra(d_id, a_id)
-            trips_dict[total_s] = {
-                'd_name':d_name,
-                'd_id':d_id,
-                'd_score':d_score,
-                'a_name':a_name,
-                'a_id':a_id,
-                'a_score':a_score,
-                'path':path,
-                'total_s':total_s
-            }
+def _candidates_by_id(names, ids, scores):
+    # plusieurs noms peuvent partager un id : on garde le mieux note
+    by_id = {}
+    for name, id_, score in zip(names, ids, scores):
+        if id_ not in by_id or score > by_id[id_]['score']:
+            by_id[id_] = {'name':name, 'id':id_, 'score':score}
+    return by_id
+
+def _seed_costs(candidates):
+    # cout initial = ecart au meilleur score de correspondance, converti en secondes
+    best = max(c['score'] for c in candidates.values())
+    return {id_: (best - c['score']) * SCORE_PENALTY_S for id_, c in candidates.items()}
 
+def _trip(d, a, path, total_s):
+    return {
+        'd_name':d['name'],
+        'd_id':d['id'],
+        'd_score':d['score'],
+        'a_name':a['name'],
+        'a_id':a['id'],
+        'a_score':a['score'],
+        'path':path,
+        'total_s':total_s
+    }
+
+def phrase_to_trip(raw_phrase, progress=None):
+    """progress : fonction appelee avec un message a chaque etape (ex : set_progress d'un background callback)."""
+    progress = progress or (lambda message: None)
+    # une seule version de la base (graphe, registre) pour toute la phrase
+    with snapshot.pinned(), metrics.span("phrase_to_trip", profile=True):
+        #1. normalize phrase
+        phrase = str(raw_phrase).lower()
+
+        progress("Extraction des gares...")
+        with metrics.span("extraction"):
+            trip_info = extract_stations_from_phrase(phrase)
+        print(trip_info)
+        if type(trip_info) == str:
+            return trip_info
+        progress("Calcul de l'itinéraire...")
+        return route_trip_info(trip_info)
+
+def route_trip_info(trip_info):
+    #find best trip : une seule recherche depuis toutes les gares de depart candidates
+    depart = _candidates_by_id(trip_info['list_gare_depart'],trip_info['list_id_gare_depart'],trip_info['list_match_score_depart'])
+    arrivee = _candidates_by_id(trip_info['list_gare_arrivee'],trip_info['list_id_gare_arrivee'],trip_info['list_match_score_arrivee'])
+    results = cached_multi_source_dijkstra(_seed_costs(depart), _seed_costs(arrivee), k=MAX_ALTERNATIVES + 1)
+
+    trips = [_trip(depart[d_id], arrivee[a_id], path, total_s) for _, d_id, a_id, path, total_s in results]
+    if not trips:
+        # aucune gare d'arrivee atteignable : on garde les meilleurs candidats sans chemin
+        best_d = max(depart.values(), key=lambda c: c['score'])
+        best_a = max(arrivee.values(), key=lambda c: c['score'])
+        trips = [_trip(best_d, best_a, None, np.inf)]
+
+    best = trips[0]
+    routes = cached_k_shortest_paths(best['d_id'], best['a_id']) if best['path'] is not None else []
     return {
         'trip_info':trip_info,
-        'best_trip':sorted(trips_dict.items())[0][1]
+        'best_trip':best,
+        'alternatives':trips[1:],
+        # autres itineraires entre les memes gares (k plus courts chemins)
+        'alternative_routes':[{'path':path, 'total_s':total_s} for path, total_s in routes if path != best['path']][:MAX_ROUTES - 1],
     }
 
+def phrases_to_trips(raw_phrases, batch_size=64, n_process=1, routes=None):
+    """phrase_to_trip sur un lot : extraction NER par lots, puis un seul routage
+    par couple (depart, arrivee) brut identique. routes peut etre partage entre appels."""
+    with snapshot.pinned():
+        routes = {} if routes is None else routes
+        phrases = [str(p).lower() for p in raw_phrases]
+        # gazetteer d'abord, le NER par lots seulement pour les phrases qu'il n'a pas resolues
+        extracted = [fast_path(p) for p in phrases]
+        misses = [i for i, d in enumerate(extracted) if d is None]
+        if misses:
+            for i, d in zip(misses, extract_gares.extract_stations_batch([phrases[i] for i in misses], batch_size, n_process)):
+                extracted[i] = d
+
+        results = []
+        for stations_dict in extracted:
+            if type(stations_dict) == str:
+                results.append(stations_dict)
+                continue
+            key = (stations_dict['raw_input_depart'], stations_dict['raw_input_arrivee'])
+            if key not in routes:
+                trip_info = trip_info_from_stations(stations_dict)
+                routes[key] = trip_info if type(trip_info) == str else route_trip_info(trip_info)
+            results.append(routes[key])
+        return results
+
 #phrase_to_trip("Je veux aller de Paris a MEtz")
 #print(phrase_to_trip("Je veux aller de Paris a MEtz"))
 
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Mode de service multi-workers (gunicorn, cf. gunicorn.conf.py).
+
+Avec preload_app, main.py est importé une seule fois dans le processus maître :
+base, graphe CSR, registre des gares et modèles NLP y sont construits avant le
+fork et partagés par tous les workers en copy-on-write.
+  - preload() charge les modèles tout de suite (pas de thread de chargement :
+    un thread ne survit pas au fork), construit le graphe transposé puis
+    gc.freeze() : le ramasse-miettes des workers ne parcourt plus (et n'écrit
+    plus dans) les objets construits par le maître ;
+  - post_fork() règle les threads torch (coeurs / workers), rouvre les
+    connexions diskcache, construit les listes de recherche du graphe et lance
+    la surveillance de la base dans chaque worker.
+
+Les gros tableaux (df, CSR, trigrammes, poids des modèles) sont des buffers
+numpy / torch que les workers ne font que lire : leurs pages restent partagées.
+Les listes python du CSR (Graph.views) ne sont construites qu'après le fork :
+chaque recherche y modifie le compteur de références des entiers, ce qui
+recopierait peu à peu des pages partagées.
+Sans preload_app (gunicorn_preload=0), chaque worker charge tout lui-même et
+post_fork() ne règle que les threads torch.
+"""
+import gc
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+
+ENABLED = os.getenv("prefork") == "1"  # positionne par gunicorn.conf.py
+
+
+def preload():
+    """A appeler dans le maître une fois l'application importée (avant le fork)."""
+    from back import extract_gares, path_finding
+    try:
+        extract_gares.load_models()
+    except Exception as e:  # l'interface reste utilisable (gazetteer, menus, API de routage)
+        print("chargement des modèles impossible :", e)
+    # CSR transpose (tableaux numpy, partages) ; les listes de recherche sont construites par worker
+    graph = path_finding.graph
+    graph.reverse()
+    graph._views = graph.reverse()._views = None
+    gc.collect()
+    gc.freeze()
+
+def torch_threads(workers):
+    """Threads torch par worker : les coeurs sont partagés entre workers."""
+    return int(os.getenv("torch_threads") or max(1, (os.cpu_count() or 1) // max(1, workers)))
+
+def post_fork(workers):
+    """A appeler dans chaque worker juste après le fork."""
+    threads = torch_threads(workers)
+    os.environ["torch_threads"] = str(threads)  # pour un chargement ulterieur (extract_gares._load_bert)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+    if not ENABLED:  # main.py pas encore importe : le worker chargera tout lui-meme
+        return
+    from back import background, hot_reload, path_finding
+    background.cache.close()  # connexions sqlite du maitre : chaque worker ouvre les siennes
+    # listes python du CSR pour la boucle de recherche, propres au worker
+    path_finding.graph.views
+    path_finding.graph.reverse().views
+    hot_reload.start_watcher()
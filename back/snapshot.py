@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+État dérivé d'une version de la base des gares : df, arcs, graphe CSR,
+registre des gares, index spatial, matcher, gazetteer. Un Snapshot est
+immuable ; hot_reload en construit un nouveau à côté et le publie par une
+seule affectation.
+
+Les modules y accèdent par leurs attributs habituels (path_finding.graph,
+stations.registry, phrase_controller.matcher...), servis par snapshot.current().
+Une requête qui lit plusieurs de ces objets se fige sur une version :
+
+    with snapshot.pinned():
+        ...  # graphe et registre de la meme version, meme si la base est rechargee entre-temps
+"""
+import threading
+from contextlib import contextmanager
+from typing import Any, NamedTuple
+
+
+class Snapshot(NamedTuple):
+    version: str = None  # empreinte de la base (cle des caches)
+    path: str = None     # fichier source (path_to_database)
+    df: Any = None
+    trip_edges: Any = None
+    best_edges: Any = None
+    graph: Any = None
+    registry: Any = None
+    spatial: Any = None
+    matcher: Any = None
+    gazetteer: Any = None
+
+
+_current = None
+_local = threading.local()
+
+def current():
+    """Version figée par le thread (pinned), sinon la dernière publiée."""
+    pinned_snapshot = getattr(_local, "snapshot", None)
+    return _current if pinned_snapshot is None else pinned_snapshot
+
+def publish(snapshot):
+    """Remplace l'état courant (une seule affectation : visible d'un coup par tous les threads)."""
+    global _current
+    _current = snapshot
+
+def extend(**parts):
+    """Complète l'état courant : au démarrage, chaque module y ajoute les objets qu'il construit."""
+    publish((_current or Snapshot())._replace(**parts))
+
+@contextmanager
+def pinned():
+    """Fige la version courante pour le thread le temps du with (un with imbriqué garde la version externe)."""
+    if getattr(_local, "snapshot", None) is not None:
+        yield _local.snapshot
+        return
+    _local.snapshot = _current
+    try:
+        yield _current
+    finally:
+        _local.snapshot = None
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Index spatial des gares : grille régulière en degrés (lat / lon), points triés
+par case. Requêtes « k gares les plus proches d'un point » (distances haversine)
+et « gares dans un rectangle » (vue courante de la carte) sans parcourir toutes
+les gares.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+CELL_DEG = 0.25  # ~28 km en latitude
+
+
+def haversine_m(lat, lon, lats, lons):
+    """Distance (m) entre un point et des tableaux de points."""
+    p1, p2 = np.radians(lat), np.radians(lats)
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(np.radians(lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """Grille de cases de cell_deg degrés ; ids = positions rendues par les requêtes (ex : index du registre)."""
+
+    def __init__(self, lats, lons, ids=None, cell_deg=CELL_DEG):
+        lats = np.asarray(lats, dtype="float64")
+        lons = np.asarray(lons, dtype="float64")
+        ids = np.arange(len(lats)) if ids is None else np.asarray(ids)
+        ok = np.isfinite(lats) & np.isfinite(lons)
+        self.cell_deg = cell_deg
+
+        rows = np.floor(lats[ok] / cell_deg).astype(np.int64)
+        cols = np.floor(lons[ok] / cell_deg).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        self.lats, self.lons, self.ids = lats[ok][order], lons[ok][order], ids[ok][order]
+        rows, cols = rows[order], cols[order]
+
+        # case (ligne, colonne) -> intervalle [debut, fin) dans les tableaux tries
+        self.cells = {}
+        if len(rows):
+            bounds = np.flatnonzero((np.diff(rows) != 0) | (np.diff(cols) != 0)) + 1
+            starts = np.concatenate(([0], bounds))
+            ends = np.concatenate((bounds, [len(rows)]))
+            for s, e in zip(starts.tolist(), ends.tolist()):
+                self.cells[(int(rows[s]), int(cols[s]))] = (s, e)
+        self.row_range = (min(r for r, _ in self.cells), max(r for r, _ in self.cells)) if self.cells else (0, -1)
+        self.col_range = (min(c for _, c in self.cells), max(c for _, c in self.cells)) if self.cells else (0, -1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _gather(self, cells):
+        spans = [self.cells[c] for c in cells if c in self.cells]
+        if not spans:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(s, e) for s, e in spans])
+
+    def nearest(self, lat, lon, k=1):
+        """(ids, distances en m) des k points les plus proches, triés par distance."""
+        k = min(k, len(self))
+        if k <= 0:
+            return self.ids[:0], np.empty(0)
+        r0, c0 = self._cell(lat, lon)
+        max_ring = max(abs(r0 - self.row_range[0]), abs(r0 - self.row_range[1]),
+                       abs(c0 - self.col_range[0]), abs(c0 - self.col_range[1]))
+        # plus petite distance couverte par un anneau de cases (les degres de longitude raccourcissent vers les poles)
+        lat_edge = min(abs(lat) + (max_ring + 1) * self.cell_deg, 89.9)
+        ring_m = 2 * math.pi * EARTH_RADIUS_M / 360 * self.cell_deg * math.cos(math.radians(lat_edge))
+
+        found = np.empty(0, dtype=np.int64)
+        for ring in range(max_ring + 1):
+            if ring == 0:
+                cells = [(r0, c0)]
+            else:
+                cells = [(r0 + dr, c0 + dc) for dr in range(-ring, ring + 1) for dc in (-ring, ring)]
+                cells += [(r0 + dr, c0 + dc) for dr in (-ring, ring) for dc in range(-ring + 1, ring)]
+            found = np.concatenate((found, self._gather(cells)))
+            if len(found) >= k:
+                dist = haversine_m(lat, lon, self.lats[found], self.lons[found])
+                kth = np.partition(dist, k - 1)[k - 1]
+                # tout point hors des anneaux parcourus est a plus de ring * ring_m
+                if kth <= ring * ring_m:
+                    break
+        dist = haversine_m(lat, lon, self.lats[found], self.lons[found])
+        best = np.argsort(dist, kind="stable")[:k]
+        return self.ids[found[best]], dist[best]
+
+    def in_bbox(self, south, west, north, east, max_points=None):
+        """ids des points dans le rectangle [south, north] x [west, east] (degrés).
+
+        max_points : au-delà, un seul point par case (cases de plus en plus grandes),
+        pour une carte dézoomée (max_points <= 0 : aucun point).
+        """
+        if max_points is not None and max_points <= 0:
+            return self.ids[:0]
+        r1, c1 = self._cell(max(south, -90), max(west, -180))
+        r2, c2 = self._cell(min(north, 90), min(east, 180))
+        r1, r2 = max(r1, self.row_range[0]), min(r2, self.row_range[1])
+        c1, c2 = max(c1, self.col_range[0]), min(c2, self.col_range[1])
+        if r1 > r2 or c1 > c2:
+            return self.ids[:0]
+        if (r2 - r1 + 1) * (c2 - c1 + 1) > len(self.cells):
+            # rectangle plus grand que la zone couverte : filtre direct
+            candidates = np.arange(len(self))
+        else:
+            candidates = self._gather([(r, c) for r in range(r1, r2 + 1) for c in range(c1, c2 + 1)])
+        lat, lon = self.lats[candidates], self.lons[candidates]
+        found = candidates[(lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)]
+
+        cell = self.cell_deg / 8
+        while max_points is not None and len(found) > max_points:
+            keys = np.floor(self.lats[found] / cell).astype(np.int64) * 1_000_003 + np.floor(self.lons[found] / cell).astype(np.int64)
+            _, first = np.unique(keys, return_index=True)
+            found = found[np.sort(first)]
+            cell *= 2
+        return self.ids[found]
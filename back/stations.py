@@ -1,14 +1,139 @@
 import os
 import sys
 
+import numpy as np
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.append(parent_dir)
 
-from back.dataframe import df
+from back import snapshot
+from back.dataframe import df, database_digest
+from back.spatial import SpatialIndex
 
 
+NGRAM = 3
+
+
+class StationRegistry:
+    """Gares dédupliquées (couple nom / id) stockées en colonnes, construites une seule fois.
+
+    Fournit des dicts id <-> nom en O(1) et un index de trigrammes sur les noms
+    en minuscules pour la recherche de candidats par sous-chaîne.
+    """
+
+    def __init__(self, names, ids, lats, lons):
+        self.names = np.asarray(names, dtype=object)
+        self.ids = np.asarray(ids, dtype=object)
+        self.lats = np.asarray(lats, dtype="float64")
+        self.lons = np.asarray(lons, dtype="float64")
+        self.lower_names = [str(n).lower() for n in self.names]
+        self.version = None  # empreinte des donnees sources (invalidation des caches)
+
+        # premiere occurrence = meme resultat que le parcours ligne a ligne du df
+        self.name_by_id = {}
+        self.id_by_name = {}
+        self.index_by_id = {}
+        self.index_by_name = {}
+        for i, (name, id_) in enumerate(zip(self.names, self.ids)):
+            self.id_by_name.setdefault(name, id_)
+            self.index_by_name.setdefault(name, i)
+            if id_ == id_:  # NaN n'est jamais egal a un id
+                self.name_by_id.setdefault(id_, name)
+                self.index_by_id.setdefault(id_, i)
+
+        grams = {}
+        for i, low in enumerate(self.lower_names):
+            for gram in {low[k:k + NGRAM] for k in range(len(low) - NGRAM + 1)}:
+                grams.setdefault(gram, []).append(i)
+        self._grams = {gram: np.array(pos, dtype=np.int32) for gram, pos in grams.items()}
+
+    @classmethod
+    def from_dataframe(cls, df):
+        stations_df = df[["stop_name", "parent_station", "stop_lat", "stop_lon"]]
+        stations_df = stations_df.drop_duplicates(subset=["stop_name", "parent_station"])
+        return cls(
+            stations_df["stop_name"].to_numpy(dtype=object),
+            stations_df["parent_station"].to_numpy(dtype=object),
+            stations_df["stop_lat"].to_numpy(dtype="float64"),
+            stations_df["stop_lon"].to_numpy(dtype="float64"),
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def find(self, raw_name):
+        """Positions (triées) des gares dont le nom contient raw_name, sans tenir compte de la casse."""
+        q = str(raw_name).lower()
+        if len(q) < NGRAM:
+            return np.array([i for i, low in enumerate(self.lower_names) if q in low], dtype=np.int32)
+
+        postings = []
+        for gram in {q[k:k + NGRAM] for k in range(len(q) - NGRAM + 1)}:
+            pos = self._grams.get(gram)
+            if pos is None:
+                return np.empty(0, dtype=np.int32)
+            postings.append(pos)
+        postings.sort(key=len)
+
+        candidates = postings[0]
+        for pos in postings[1:]:
+            candidates = np.intersect1d(candidates, pos, assume_unique=True)
+            if not len(candidates):
+                break
+        # les trigrammes ne garantissent pas l'ordre : on verifie la sous-chaine
+        return np.array([i for i in candidates.tolist() if q in self.lower_names[i]], dtype=np.int32)
+
+    def candidates(self, raw_name):
+        """(ids, noms) uniques des gares dont le nom contient raw_name, dans l'ordre du df."""
+        positions = self.find(raw_name)
+        ids = dict.fromkeys(self.ids[positions].tolist())
+        names = dict.fromkeys(self.names[positions].tolist())
+        return [*ids], [*names]
+
+    def locate(self, ids):
+        """Noms, latitudes et longitudes d'une liste d'ids (ex : un chemin)."""
+        positions = [self.index_by_id[id_] for id_ in ids]
+        return self.names[positions].tolist(), self.lats[positions].tolist(), self.lons[positions].tolist()
+
+
+def build_spatial_index(registry):
+    """Index spatial sur les gares affichees (une par nom, comme get_all_stations)."""
+    positions = np.fromiter(registry.index_by_name.values(), dtype=np.int64)
+    return SpatialIndex(registry.lats[positions], registry.lons[positions], ids=positions)
+
+def __getattr__(name):
+    # registre et index spatial de la base courante (cf. snapshot)
+    if name in ("registry", "spatial"):
+        return getattr(snapshot.current(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+_registry = StationRegistry.from_dataframe(df)
+_registry.version = database_digest
+snapshot.extend(registry=_registry, spatial=build_spatial_index(_registry))
+del _registry
+
+def _station_at(i, registry=None):
+    if registry is None:
+        registry = snapshot.current().registry
+    return {
+        "name":registry.names[i],
+        "id":registry.ids[i],
+        "lat":float(registry.lats[i]),
+        "lon":float(registry.lons[i]),
+    }
+
+def nearest_stations(lat, lon, k=1):
+    """Les k gares les plus proches d'un point (ex : clic sur la carte, position GPS)."""
+    current = snapshot.current()
+    positions, distances = current.spatial.nearest(lat, lon, k)
+    return [{**_station_at(i, current.registry), "distance_m":float(d)} for i, d in zip(positions.tolist(), distances.tolist())]
+
+def stations_in_bbox(south, west, north, east, max_points=None):
+    """Gares dans le rectangle (vue courante de la carte), au plus ~max_points."""
+    current = snapshot.current()
+    return [_station_at(i, current.registry) for i in current.spatial.in_bbox(south, west, north, east, max_points).tolist()]
+
 
 def get_all_stations():
     stations = {
@@ -17,38 +142,29 @@ def get_all_stations():
         "lons":[],
         "names":[]
     }
-    for stop_name, lon, lat,id in zip(df["stop_name"], df["stop_lon"],df["stop_lat"],df["parent_station"]):
-        if stop_name not in stations:
-            stations["stations"][stop_name] = {
-                "lon":lon,
-                "lat":lat,
-                "id":id
-            }
-            stations["lons"].append(lon)
-            stations["lats"].append(lat)
-            stations["names"].append(stop_name)
+    registry = snapshot.current().registry
+    for name, i in registry.index_by_name.items():
+        lat, lon = float(registry.lats[i]), float(registry.lons[i])
+        stations["stations"][name] = {
+            "lon":lon,
+            "lat":lat,
+            "id":registry.ids[i]
+        }
+        stations["lons"].append(lon)
+        stations["lats"].append(lat)
+        stations["names"].append(name)
 
     return stations
 
 def get_station_name_by_id(id):
-    for name, id_ in zip(df["stop_name"],df["parent_station"],):
-        if id_ == id:
-            return name
-    return None
+    return snapshot.current().registry.name_by_id.get(id)
 
 def get_station_id_by_name(name):
-    for name_, id_ in zip(df["stop_name"],df["parent_station"],):
-        if str(name).lower() in str(name_).lower():
-            return id_
-    return None
+    registry = snapshot.current().registry
+    positions = registry.find(name)
+    if not len(positions):
+        return None
+    return registry.ids[positions[0]]
 
 def get_station_candidates_by_raw_name(name):
-    potential_stations_ids = []
-    potential_stations_names = []
-    for name_, id_ in zip(df["stop_name"],df["parent_station"],):
-        if str(name).lower() in str(name_).lower():
-            potential_stations_ids.append(id_)
-            potential_stations_names.append(name_)
-            #return id_
-    return [*set(potential_stations_ids)],[*set(potential_stations_names)]
-
+    return snapshot.current().registry.candidates(name)
@@ -0,0 +1,227 @@
+import os
+import sys
+import threading
+from bisect import bisect_right
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(parent_dir)
+
+from back import path_finding
+from back.path_finding import NODE_COL
+
+import numpy as np
+import pandas as pd
+
+
+INF = float("inf")
+CHUNK = 4096             # connexions converties en listes python par paquet pendant le scan
+MAX_JOURNEY_S = 36 * 3600  # horizon max d'un trajet pour les requetes de profil
+
+
+def parse_time(t) -> int:
+    """Secondes depuis minuit a partir d'un entier ou d'une chaine "HH:MM" / "HH:MM:SS"."""
+    if isinstance(t, (int, float, np.integer, np.floating)):
+        return int(t)
+    parts = [int(x) for x in str(t).strip().split(":")]
+    parts += [0] * (3 - len(parts))
+    h, m, s = parts
+    return h * 3600 + m * 60 + s
+
+
+def _scan(arrays, start, stop, step=1):
+    """Parcourt les connexions [start, stop) par paquets de listes python (rapide sans copier tout le tableau)."""
+    if step > 0:
+        for lo in range(start, stop, CHUNK):
+            hi = min(lo + CHUNK, stop)
+            yield from zip(range(lo, hi), *(a[lo:hi].tolist() for a in arrays))
+    else:
+        for hi in range(stop, start, -CHUNK):
+            lo = max(hi - CHUNK, start)
+            chunk = [a[lo:hi].tolist() for a in arrays]
+            yield from zip(range(hi - 1, lo - 1, -1), *(c[::-1] for c in chunk))
+
+
+class Timetable:
+    """Connection Scan Algorithm sur les horaires (dep_s_norm / arr_s_norm).
+
+    Chaque couple d'arrets consecutifs d'un trip devient une connexion ; les
+    connexions sont stockees dans des tableaux numpy tries par heure de depart.
+    """
+
+    def __init__(self, stops, trip_ids, node_col, conn_dep_stop, conn_arr_stop, conn_dep, conn_arr, conn_trip, conn_row):
+        self.stops = stops
+        self.stop_index = {s: i for i, s in enumerate(stops)}
+        self.trip_ids = trip_ids
+        self.node_col = node_col  # id de gare par ligne du df trie (pour les arrets intermediaires)
+        self.dep_stop = conn_dep_stop
+        self.arr_stop = conn_arr_stop
+        self.dep = conn_dep
+        self.arr = conn_arr
+        self.trip = conn_trip
+        self.row = conn_row
+
+    @classmethod
+    def from_dataframe(cls, df, node_col=NODE_COL):
+        """df trie par (trip_id, stop_sequence) avec les colonnes dep_s_norm / arr_s_norm."""
+        stop_codes, stops = pd.factorize(df[node_col])
+        trip_codes, trip_ids = pd.factorize(df["trip_id"])
+        dep_s = df["dep_s_norm"].to_numpy(dtype="float64")
+        arr_s = df["arr_s_norm"].to_numpy(dtype="float64")
+
+        u, v = stop_codes[:-1], stop_codes[1:]
+        dep, arr = dep_s[:-1], arr_s[1:]
+        keep = (
+            (trip_codes[:-1] == trip_codes[1:])
+            & (u >= 0) & (v >= 0)
+            & ~np.isnan(dep) & ~np.isnan(arr)
+        )
+        keep[keep] &= arr[keep] >= dep[keep]
+        rows = np.flatnonzero(keep)
+
+        order = np.lexsort((rows, dep[rows]))
+        rows = rows[order]
+        return cls(
+            stops=np.asarray(stops, dtype=object),
+            trip_ids=np.asarray(trip_ids, dtype=object),
+            node_col=df[node_col].to_numpy(dtype=object),
+            conn_dep_stop=u[rows].astype(np.int32),
+            conn_arr_stop=v[rows].astype(np.int32),
+            conn_dep=dep[rows].astype(np.int32),
+            conn_arr=arr[rows].astype(np.int32),
+            conn_trip=trip_codes[:-1][rows].astype(np.int32),
+            conn_row=rows.astype(np.int32),
+        )
+
+    def __len__(self):
+        return len(self.dep)
+
+    def earliest_arrival(self, source, target, dep_time, min_transfer_s=0):
+        """Trajet arrivant le plus tot a target en partant de source apres dep_time.
+
+        Retourne (path, legs, arrival_s) ou (None, [], inf) si target n'est pas atteignable.
+        """
+        s, t = self.stop_index.get(source), self.stop_index.get(target)
+        if s is None or t is None:
+            return None, [], INF
+        t0 = parse_time(dep_time)
+        if s == t:
+            return [source], [], t0
+
+        ea = [INF] * len(self.stops)
+        ea[s] = t0
+        boarded = [-1] * len(self.trip_ids)   # connexion de montee par trip
+        reached_by = {}                       # arret -> (connexion de montee, connexion de descente)
+
+        start = int(np.searchsorted(self.dep, t0, side="left"))
+        arrays = (self.dep_stop, self.arr_stop, self.dep, self.arr, self.trip)
+        for i, u, v, dep, arr, trip in _scan(arrays, start, len(self.dep)):
+            if dep >= ea[t]:
+                break
+            if boarded[trip] < 0:
+                ready = ea[u] if u == s else ea[u] + min_transfer_s
+                if ready > dep:
+                    continue
+                boarded[trip] = i
+            if arr < ea[v]:
+                ea[v] = arr
+                reached_by[v] = (boarded[trip], i)
+
+        if ea[t] == INF:
+            return None, [], INF
+        path, legs = self._unpack(s, t, reached_by)
+        return path, legs, ea[t]
+
+    def _unpack(self, s, t, reached_by):
+        legs = []
+        stop = t
+        while stop != s:
+            board, alight = reached_by[stop]
+            r0, r1 = int(self.row[board]), int(self.row[alight]) + 1
+            legs.append({
+                "trip_id": self.trip_ids[self.trip[board]],
+                "from": self.stops[self.dep_stop[board]],
+                "to": self.stops[self.arr_stop[alight]],
+                "dep_s": int(self.dep[board]),
+                "arr_s": int(self.arr[alight]),
+                "stops": self.node_col[r0:r1 + 1].tolist(),
+            })
+            stop = int(self.dep_stop[board])
+        legs.reverse()
+
+        path = [legs[0]["stops"][0]]
+        for leg in legs:
+            path.extend(leg["stops"][1:])
+        return path, legs
+
+    def profile(self, source, target, window_start, window_end, min_transfer_s=0):
+        """Tous les trajets Pareto-optimaux (depart, arrivee) de source vers target
+        dont l'heure de depart est dans [window_start, window_end].
+
+        Un seul scan a rebours des connexions (profile CSA).
+        """
+        s, t = self.stop_index.get(source), self.stop_index.get(target)
+        if s is None or t is None:
+            return []
+        w0, w1 = parse_time(window_start), parse_time(window_end)
+
+        # profils par arret : departs decroissants (negatifs pour bisect) et arrivees associees
+        prof_dep = [[] for _ in range(len(self.stops))]
+        prof_arr = [[] for _ in range(len(self.stops))]
+        trip_arr = [INF] * len(self.trip_ids)
+
+        start = int(np.searchsorted(self.dep, w0, side="left"))
+        stop = int(np.searchsorted(self.dep, w1 + MAX_JOURNEY_S, side="right"))
+        arrays = (self.dep_stop, self.arr_stop, self.dep, self.arr, self.trip)
+        for _, u, v, dep, arr, trip in _scan(arrays, start, stop, step=-1):
+            best = arr if v == t else INF
+            if trip_arr[trip] < best:
+                best = trip_arr[trip]
+            deps_v = prof_dep[v]
+            if deps_v:
+                # entrees de v avec depart >= arr + correspondance : prefixe de la liste,
+                # la derniere de ce prefixe a la meilleure arrivee
+                j = bisect_right(deps_v, -(arr + min_transfer_s)) - 1
+                if j >= 0 and prof_arr[v][j] < best:
+                    best = prof_arr[v][j]
+            if best == INF:
+                continue
+            trip_arr[trip] = best
+            if u == t:
+                continue
+            arrs_u = prof_arr[u]
+            if not arrs_u or best < arrs_u[-1]:
+                if arrs_u and prof_dep[u][-1] == -dep:
+                    arrs_u[-1] = best
+                else:
+                    prof_dep[u].append(-dep)
+                    arrs_u.append(best)
+
+        journeys = [(-d, a) for d, a in zip(prof_dep[s], prof_arr[s]) if w0 <= -d <= w1]
+        journeys.reverse()
+        return journeys
+
+
+_current = (None, None)  # (df source, horaires)
+_current_lock = threading.Lock()
+
+def _after_fork():
+    global _current_lock
+    _current_lock = threading.Lock()  # processus forke : le verrou du parent peut etre tenu
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def current():
+    """Horaires de la base courante (reconstruits après un rechargement, cf. hot_reload)."""
+    global _current
+    df, timetable = _current
+    latest = path_finding.df
+    if df is not latest:
+        with _current_lock:
+            df, timetable = _current
+            if df is not latest:
+                timetable = Timetable.from_dataframe(latest)
+                _current = (latest, timetable)
+    return timetable
+
+current()
@@ -1,13 +1,39 @@
 # -*- coding: utf-8 -*-
 """
 Entraînement du modèle NER spaCy à partir du dataset (DEP, ARR).
-À lancer une fois pour générer le modèle model_ner/ 
+À lancer une fois pour générer le modèle model_ner/
+
+Les exemples sont tokenisés une seule fois et sauvegardés dans un DocBin
+(<path_to_cache>/ner_<empreinte>.spacy), réutilisé tant que dataset.csv ne change pas.
+Entraînement par minibatchs de taille croissante avec dropout ; une partie du
+dataset est gardée pour l'évaluation (F1 sur les entités) et l'entraînement
+s'arrête quand le F1 ne progresse plus. Le meilleur modèle est enregistré.
+
+    python back/train_ner.py --epochs 30 --patience 3 --n-process 4
 """
+import argparse
+import hashlib
+import random
 import re
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
 import spacy
+from spacy.tokens import DocBin
 from spacy.training import Example
-import pandas as pd
-from pathlib import Path
+from spacy.util import minibatch, compounding
+from dotenv import load_dotenv
+load_dotenv()
+
+base = Path(__file__).parent
+DATA_PATH = base / "database" / "dataset.csv"
+# meme dossier que dataframe.cache_dir (path_to_cache), sans importer dataframe qui charge la base
+_database_dir = Path(os.getenv("path_to_database")).parent if os.getenv("path_to_database") else base / "database"
+CACHE_DIR = Path(os.getenv("path_to_cache") or _database_dir / "cache")
+DOCBIN_VERSION = 1  # a incrementer si la preparation des exemples change
+
 
 def parser_nlp_tuple(nlp_tuple_str):
     """Extrait les entités (start, end, label) depuis la chaîne nlp_tuple."""
@@ -19,9 +45,64 @@ def parser_nlp_tuple(nlp_tuple_str):
             entities.append((start, end, label))
     return entities
 
+def lire_dataset(data_path):
+    """(phrases, entités) valides du dataset csv."""
+    df = pd.read_csv(data_path, encoding="utf-8", usecols=["sentence", "nlp_tuple"])
+    df = df.dropna(subset=["sentence"])
+    phrases = df["sentence"].astype(str).str.strip()
+    entites = [parser_nlp_tuple(str(t)) for t in df["nlp_tuple"]]
+    return [(p, e) for p, e in zip(phrases, entites) if p and e]
+
+def preparer_docbin(nlp, data_path, n_process=1):
+    """Docs annotés (DocBin), construits une fois puis relus depuis le cache."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(Path(data_path).read_bytes())
+    cached = CACHE_DIR / f"ner_{h.hexdigest()}_v{DOCBIN_VERSION}.spacy"
+    if cached.exists():
+        return DocBin().from_disk(cached)
+
+    data = lire_dataset(data_path)
+    doc_bin = DocBin()
+    ignorees = 0
+    # tokenisation seule (aucun composant), en parallele si n_process > 1
+    with nlp.select_pipes(disable=nlp.pipe_names):
+        docs = nlp.pipe((p for p, _ in data), batch_size=1000, n_process=n_process)
+        for doc, (_, entites) in zip(docs, data):
+            spans = [doc.char_span(s, e, label=l, alignment_mode="contract") for s, e, l in entites]
+            if any(span is None for span in spans):
+                ignorees += 1  # entites qui ne tombent pas sur des frontieres de tokens
+                continue
+            try:
+                doc.ents = spans
+            except ValueError:
+                ignorees += 1  # entites qui se chevauchent
+                continue
+            doc_bin.add(doc)
+    print(f"{len(doc_bin)} exemples préparés, {ignorees} ignorés (entités mal alignées)")
+
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_suffix(".tmp")
+    doc_bin.to_disk(tmp)
+    tmp.replace(cached)
+    return doc_bin
+
+def evaluer(nlp, exemples):
+    scores = nlp.evaluate(exemples)
+    return scores["ents_p"] or 0.0, scores["ents_r"] or 0.0, scores["ents_f"] or 0.0
+
 def main():
-    data_path = Path(__file__).parent / "database" / "dataset.csv"
-    df = pd.read_csv(data_path, encoding="utf-8")
+    parser = argparse.ArgumentParser(description="entraînement du NER départ / arrivée")
+    parser.add_argument("--epochs", type=int, default=30, help="nombre max d'epochs")
+    parser.add_argument("--patience", type=int, default=3, help="epochs sans progrès du F1 avant arrêt")
+    parser.add_argument("--dropout", type=float, default=0.2)
+    parser.add_argument("--batch-start", type=float, default=4.0, help="taille de minibatch initiale")
+    parser.add_argument("--batch-end", type=float, default=32.0, help="taille de minibatch maximale")
+    parser.add_argument("--dev-fraction", type=float, default=0.1, help="part du dataset gardée pour l'évaluation")
+    parser.add_argument("--n-process", type=int, default=1, help="processus pour la tokenisation du dataset")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default=str(base / "model_ner"))
+    args = parser.parse_args()
+
     # Charger le modèle français de base (sans NER personnalisé au départ)
     nlp = spacy.load("fr_core_news_sm")
     if "ner" not in nlp.pipe_names:
@@ -31,31 +112,36 @@ def main():
     ner.add_label("DEP")
     ner.add_label("ARR")
 
-    train_data = []
-    for _, row in df.iterrows():
-        phrase = row["sentence"]
-        if pd.isna(phrase) or not str(phrase).strip():
-            continue
-        phrase = str(phrase).strip()
-        ent = parser_nlp_tuple(str(row["nlp_tuple"]))
-        if not ent:
-            continue
-        train_data.append((phrase, {"entities": [(s, e, l) for s, e, l in ent]}))
-
-    import random
-    random.seed(42)
+    docs = list(preparer_docbin(nlp, DATA_PATH, args.n_process).get_docs(nlp.vocab))
+    random.seed(args.seed)
+    random.shuffle(docs)
+    n_dev = max(1, int(len(docs) * args.dev_fraction))
+    exemples = [Example(nlp.make_doc(doc.text), doc) for doc in docs]
+    dev, train = exemples[:n_dev], exemples[n_dev:]
+    print(f"{len(train)} exemples d'entraînement, {len(dev)} d'évaluation")
+
     other_pipes = [p for p in nlp.pipe_names if p != "ner"]
-    with nlp.disable_pipes(*other_pipes):
-        n_iter = 25
-        optimizer = nlp.begin_training()
-        for it in range(n_iter):
-            random.shuffle(train_data)
-            for text, annotations in train_data:
-                doc = nlp.make_doc(text)
-                example = Example.from_dict(doc, annotations)
-                nlp.update([example], sgd=optimizer)
-
-    out_dir = Path(__file__).parent / "model_ner"
+    with nlp.select_pipes(disable=other_pipes):
+        optimizer = nlp.initialize(lambda: train)
+        best_f, best_epoch, best_ner = -1.0, 0, None
+        for epoch in range(1, args.epochs + 1):
+            t0 = time.perf_counter()
+            random.shuffle(train)
+            losses = {}
+            for batch in minibatch(train, size=compounding(args.batch_start, args.batch_end, 1.001)):
+                nlp.update(batch, sgd=optimizer, drop=args.dropout, losses=losses)
+            p, r, f = evaluer(nlp, dev)
+            print(f"epoch {epoch:2d}  loss {losses.get('ner', 0.0):9.2f}  P {p:.3f}  R {r:.3f}  F1 {f:.3f}  "
+                  f"{time.perf_counter() - t0:6.1f}s")
+            if f > best_f:
+                best_f, best_epoch, best_ner = f, epoch, ner.to_bytes()
+            elif epoch - best_epoch >= args.patience:
+                print(f"arrêt : pas de progrès du F1 depuis {args.patience} epochs")
+                break
+        ner.from_bytes(best_ner)
+    print(f"meilleur F1 dev = {best_f:.3f} (epoch {best_epoch})")
+
+    out_dir = Path(args.output)
     out_dir.mkdir(exist_ok=True)
     nlp.to_disk(out_dir)
     print("Modèle NER enregistré dans", out_dir)
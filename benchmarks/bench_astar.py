@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Gares fixées et temps par requête : dijkstra vs A* bidirectionnel
+(vs contraction hierarchies si la hiérarchie a déjà été construite).
+Chaque méthode est comparée à dijkstra sur les deux mesures : moins de gares
+fixées ne suffit pas, le temps mur doit baisser aussi.
+
+    python benchmarks/bench_astar.py --queries 1000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from back import path_finding, contraction
+from run_benchmarks import reachable_pairs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    pairs = reachable_pairs(path_finding.graph, args.queries, random.Random(args.seed))
+    methods = ["dijkstra", "astar"]
+    if contraction.hierarchy_path().exists():
+        methods.append("ch")
+
+    # construit les listes de recherche avant de mesurer
+    path_finding.shortest_path(*pairs[0], method="astar")
+    reference = None
+    for method in methods:
+        stats = {}
+        t0 = time.perf_counter()
+        durations = [path_finding.shortest_path(s, t, method=method, stats=stats)[1] for s, t in pairs]
+        ms = (time.perf_counter() - t0) / len(pairs) * 1e3
+        settled = stats.get("settled", 0) / len(pairs)
+        if reference is None:
+            reference, ref_ms, ref_settled = durations, ms, settled
+        assert durations == reference, f"{method} ne donne pas les memes durees que dijkstra"
+        print(f"{method:9s}: {settled:8.1f} gares fixees / requete (x{ref_settled / max(settled, 1e-9):.2f}), "
+              f"{ms:.3f} ms / requete (x{ref_ms / ms:.2f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Compare le Dijkstra CSR (path_finding.dijkstra) à l'ancienne version sur dict
+(path_finding.dijkstra_adj) sur la base pointée par path_to_database (.env).
+Couples reliés uniquement (run_benchmarks.reachable_pairs) : un couple sans chemin
+explore toute la composante et ne mesure que le parcours complet.
+
+    python benchmarks/bench_dijkstra.py --queries 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from back import path_finding
+from run_benchmarks import reachable_pairs
+
+
+def timed(fn, pairs):
+    t0 = time.perf_counter()
+    out = [fn(s, t)[1] for s, t in pairs]
+    return time.perf_counter() - t0, out
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    graph = path_finding.graph
+    pairs = reachable_pairs(graph, args.queries, random.Random(args.seed), max_hops=64)
+    print(f"{len(graph)} gares, {len(graph.indices)} arcs, {len(pairs)} requetes")
+
+    # adjacence (dict) et listes CSR construites hors mesure
+    path_finding.dijkstra_adj(*pairs[0])
+    path_finding.dijkstra(*pairs[0])
+    t_adj, d_adj = timed(path_finding.dijkstra_adj, pairs)
+    t_csr, d_csr = timed(path_finding.dijkstra, pairs)
+    assert d_adj == d_csr, "les deux implementations ne donnent pas les memes durees"
+
+    print(f"dict : {t_adj / len(pairs) * 1e3:.3f} ms / requete")
+    print(f"csr  : {t_csr / len(pairs) * 1e3:.3f} ms / requete")
+    print(f"speedup x{t_adj / t_csr:.2f}")
+
+if __name__ == "__main__":
+    main()
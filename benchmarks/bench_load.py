@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Temps de chargement et pic de RSS de la base (path_to_database) :
+  legacy : pd.read_csv par défaut (ancien dataframe.py)
+  typed  : read_database_csv (colonnes utiles, dtypes compacts, moteur pyarrow)
+  cached : load_database avec le cache feather déjà écrit
+Chaque mode tourne dans un processus neuf qui n'a pas encore importé
+back.dataframe (son import charge la base) : le pic RSS est mesuré au-delà de
+la mémoire occupée par pandas / pyarrow. typed part d'un cache vide (dossier
+temporaire, path_to_cache) et inclut donc l'écriture du feather que cached relit.
+
+    python benchmarks/bench_load.py
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.append(ROOT)
+
+MODES = ["legacy", "typed", "cached"]
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def run_child(mode):
+    import contextlib
+    import pandas as pd
+    import pyarrow.feather  # noqa: F401  (imports hors mesure)
+    from dotenv import load_dotenv
+    load_dotenv()
+    path = os.getenv("path_to_database")
+
+    before = rss_mb()
+    t0 = time.perf_counter()
+    if mode == "legacy":
+        df = pd.read_csv(path, encoding="utf-8", sep=";")
+    else:
+        # l'import de back.dataframe est le chargement mesure (csv si le cache est vide, sinon feather)
+        with contextlib.redirect_stdout(sys.stderr):
+            from back import dataframe
+        df = dataframe.df
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "mode": mode,
+        "load_s": round(elapsed, 3),
+        "peak_rss_mb": round(max(peak, rss_mb()) - before, 1),
+        "frame_mb": round(df.memory_usage(deep=True).sum() / 2**20, 1),
+        "rows": len(df),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_child(args.child)
+
+    # cache feather dans un dossier neuf : typed l'ecrit, cached le relit
+    cache = tempfile.mkdtemp(prefix="bench_load_")
+    env = {**os.environ, "path_to_cache": cache}
+    try:
+        results = [subprocess.run([sys.executable, __file__, "--child", mode], capture_output=True, text=True,
+                                  check=True, cwd=ROOT, env=env) for mode in MODES]
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+    for out in results:
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{r['mode']:7s} : {r['load_s']:7.3f} s, pic RSS +{r['peak_rss_mb']:7.1f} Mo, "
+              f"dataframe {r['frame_mb']:7.1f} Mo, {r['rows']} lignes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Génère un réseau ferré synthétique au format de res.csv (séparateur ;) :
+trip_id, arrival_time, departure_time, stop_id, stop_sequence, stop_name,
+stop_lat, stop_lon, parent_station.
+
+Les lignes sont des marches aléatoires dans l'emprise de la France ; chaque
+nouvelle ligne part d'une gare existante (réseau connexe) et passe parfois par
+une gare déjà créée voisine (correspondances). Chaque ligne est parcourue dans
+les deux sens plusieurs fois par jour, une partie des départs ne desservant
+qu'un tronçon ; heures au format GTFS (>= 24:00 possible).
+Même graine => même fichier.
+
+    python benchmarks/generate_network.py --stations 10000 -o benchmarks/data/network_10k.csv
+"""
+import argparse
+import math
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+# emprise approximative de la France metropolitaine
+LAT_MIN, LAT_MAX = 42.4, 51.0
+LON_MIN, LON_MAX = -4.7, 8.1
+CELL_DEG = 0.1                 # cote des cases de la grille de voisinage
+SPEED_KMH = (60, 160)          # vitesse commerciale par ligne
+DWELL_S = (60, 300)            # arret en gare
+STEP_KM = (4, 25)              # distance entre deux gares consecutives
+LINE_STOPS = (5, 30)
+TRANSFER_P = 0.12              # probabilite de passer par une gare existante voisine
+TERMINUS_P = 0.7               # probabilite qu'une nouvelle ligne parte d'un terminus existant
+PARTIAL_P = 0.7                # probabilite qu'un depart ne desserve qu'une partie de la ligne
+
+# gares reelles en tete de liste : utiles pour les phrases de test
+ANCHORS = [
+    ("Paris Est", 48.8768, 2.3592), ("Paris Gare de Lyon", 48.8443, 2.3744),
+    ("Metz Ville", 49.1097, 6.1770), ("Nancy Ville", 48.6898, 6.1744),
+    ("Lyon Part Dieu", 45.7606, 4.8594), ("Marseille St Charles", 43.3028, 5.3806),
+    ("Lille Flandres", 50.6365, 3.0704), ("Strasbourg", 48.5850, 7.7350),
+    ("Bordeaux St Jean", 44.8258, -0.5560), ("Toulouse Matabiau", 43.6113, 1.4535),
+]
+SYLLABES = ["mont", "bel", "ville", "cour", "ber", "lan", "chat", "eau", "roche", "val", "fon",
+            "taine", "mar", "sai", "lon", "gny", "bour", "ges", "pie", "rre", "neuf", "vi", "la", "tre"]
+SUFFIXES = ["", "", "", " Ville", " Centre", " Nord", " Sud", "-sur-Marne", "-les-Bains", " Gare"]
+
+
+def station_names(n, rng):
+    names, seen = [], set()
+    for name, _, _ in ANCHORS[:n]:
+        names.append(name)
+        seen.add(name)
+    while len(names) < n:
+        base = "".join(rng.choice(SYLLABES) for _ in range(rng.randint(2, 3))).capitalize()
+        prefix = "Saint-" if rng.random() < 0.08 else ""
+        name = prefix + base + rng.choice(SUFFIXES)
+        if name in seen:
+            name = f"{name} {len(names)}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+def build_lines(n_stations, rng):
+    """Coordonnees des gares et lignes (listes d'indices de gares)."""
+    lats, lons, lines = [], [], []
+    grid = {}
+
+    def add_station(lat, lon):
+        lats.append(lat)
+        lons.append(lon)
+        grid.setdefault((int(lat / CELL_DEG), int(lon / CELL_DEG)), []).append(len(lats) - 1)
+        return len(lats) - 1
+
+    for _, lat, lon in ANCHORS[:n_stations]:
+        add_station(lat, lon)
+    if not lats:
+        add_station(rng.uniform(LAT_MIN, LAT_MAX), rng.uniform(LON_MIN, LON_MAX))
+
+    n_anchors = min(len(ANCHORS), n_stations)
+    termini = []
+    while len(lats) < n_stations or len(lines) < n_anchors:
+        # une premiere ligne par gare reelle, puis depart d'un terminus (pole) ou d'une gare existante
+        if len(lines) < n_anchors:
+            current = len(lines)
+        elif termini and rng.random() < TERMINUS_P:
+            current = rng.choice(termini)
+        else:
+            current = rng.randrange(len(lats))
+        line = [current]
+        heading = rng.uniform(0, 2 * math.pi)
+        for _ in range(rng.randint(*LINE_STOPS) - 1):
+            heading += rng.gauss(0, 0.35)
+            step = rng.uniform(*STEP_KM)
+            lat = lats[current] + step / 111.0 * math.cos(heading)
+            lon = lons[current] + step / (111.0 * math.cos(math.radians(lats[current]))) * math.sin(heading)
+            if not (LAT_MIN < lat < LAT_MAX and LON_MIN < lon < LON_MAX):
+                heading += math.pi  # demi-tour au bord de la carte
+                continue
+            nearby = grid.get((int(lat / CELL_DEG), int(lon / CELL_DEG)), [])
+            if nearby and rng.random() < TRANSFER_P:
+                nxt = rng.choice(nearby)
+            elif len(lats) < n_stations:
+                nxt = add_station(lat, lon)
+            else:
+                break
+            if nxt not in line:
+                line.append(nxt)
+                current = nxt
+        if len(line) > 1:
+            lines.append(line)
+            termini += [line[0], line[-1]]
+    return np.array(lats), np.array(lons), lines
+
+def hms(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def generate(n_stations, trips_per_line=6, seed=0):
+    """DataFrame au format res.csv pour un reseau de n_stations gares."""
+    rng = random.Random(seed)
+    names = station_names(n_stations, rng)
+    lats, lons, lines = build_lines(n_stations, rng)
+
+    rows = {k: [] for k in ("trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence",
+                            "stop_name", "stop_lat", "stop_lon", "parent_station")}
+    trip = 0
+    for line_no, line in enumerate(lines):
+        speed = rng.uniform(*SPEED_KMH) / 3.6 / 1000  # km / s
+        for direction in (line, line[::-1]):
+            for _ in range(trips_per_line):
+                stops = direction
+                if len(direction) > 2 and rng.random() < PARTIAL_P:
+                    i = rng.randrange(len(direction) - 1)
+                    stops = direction[i:rng.randint(i + 2, len(direction))]
+                t = rng.randint(5 * 3600, 22 * 3600)
+                for seq, s in enumerate(stops):
+                    if seq:
+                        prev = stops[seq - 1]
+                        t += haversine_km(lats[prev], lons[prev], lats[s], lons[s]) / speed
+                    arrival = t
+                    t += rng.randint(*DWELL_S) if 0 < seq < len(stops) - 1 else 0
+                    rows["trip_id"].append(f"OCESN{trip}F")
+                    rows["arrival_time"].append(hms(arrival))
+                    rows["departure_time"].append(hms(t))
+                    rows["stop_id"].append(f"StopPoint:OCETrain-{s}-L{line_no}")
+                    rows["stop_sequence"].append(seq)
+                    rows["stop_name"].append(names[s])
+                    rows["stop_lat"].append(round(lats[s], 6))
+                    rows["stop_lon"].append(round(lons[s], 6))
+                    rows["parent_station"].append(f"StopArea:OCE{s}")
+                trip += 1
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="réseau ferré synthétique au format res.csv")
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--trips-per-line", type=int, default=6, help="départs par ligne et par sens")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+
+    df = generate(args.stations, args.trips_per_line, args.seed)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    df.to_csv(args.output, sep=";", index=False, encoding="utf-8")
+    print(f"{args.output} : {df['parent_station'].nunique()} gares, {df['trip_id'].nunique()} trips, {len(df)} lignes")
+
+if __name__ == "__main__":
+    main()
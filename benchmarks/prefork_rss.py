@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Mémoire par worker gunicorn avec et sans préchargement dans le maître
+(gunicorn.conf.py, gunicorn_preload=1 / 0).
+
+Pour chaque mode : lancement de gunicorn, attente de la première réponse
+(démarrage à froid), quelques requêtes de routage pour chauffer les workers,
+puis mesure de chaque processus :
+  rss : mémoire résidente (pages partagées comptées dans chaque worker)
+  pss : part proportionnelle des pages partagées
+  uss : pages propres au processus (ce qu'un worker de plus coûte)
+
+    python benchmarks/prefork_rss.py --workers 4 --requests 200
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+import psutil
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, os.pardir))
+
+
+def get_json(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        return json.loads(r.read())
+
+def wait_ready(base, proc, timeout):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        if proc.poll() is not None:
+            raise SystemExit("gunicorn s'est arrêté au démarrage")
+        try:
+            get_json(f"{base}/api/stations/bbox?south=-90&west=-180&north=90&east=180&limit=1", timeout=2)
+            return time.perf_counter() - t0
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"gunicorn ne répond pas après {timeout}s")
+
+def memory(pid):
+    p = psutil.Process(pid)
+    info = p.memory_full_info()
+    return {"pid": pid, "rss_mb": round(info.rss / 1e6, 1), "pss_mb": round(getattr(info, "pss", 0) / 1e6, 1),
+            "uss_mb": round(info.uss / 1e6, 1)}
+
+def run_mode(preload, args, seed):
+    base = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, "gunicorn_preload": "1" if preload else "0", "gunicorn_workers": str(args.workers),
+           "gunicorn_bind": f"127.0.0.1:{args.port}"}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first = wait_ready(base, proc, args.timeout)
+        # tous les workers doivent avoir demarre (sans preload chacun charge tout)
+        while len(psutil.Process(proc.pid).children()) < args.workers and time.perf_counter() - t0 < args.timeout:
+            time.sleep(0.2)
+        stations = get_json(f"{base}/api/stations/bbox?south=-90&west=-180&north=90&east=180&limit=5000")
+        ids = [s["id"] for s in stations]
+        rng = random.Random(seed)
+        t1 = time.perf_counter()
+        for _ in range(args.requests):
+            d, a = rng.sample(ids, 2)
+            get_json(f"{base}/api/route?" + urllib.parse.urlencode({"from": d, "to": a}))
+        requests_s = time.perf_counter() - t1
+        time.sleep(1)  # le temps que les workers les plus lents finissent de charger
+
+        workers = [memory(c.pid) for c in psutil.Process(proc.pid).children()]
+        return {
+            "preload": preload,
+            "first_response_s": round(first, 2),
+            "requests_per_s": round(args.requests / requests_s, 1),
+            "master": memory(proc.pid),
+            "workers": workers,
+            "worker_rss_mean_mb": round(sum(w["rss_mb"] for w in workers) / len(workers), 1),
+            "worker_uss_mean_mb": round(sum(w["uss_mb"] for w in workers) / len(workers), 1),
+            "total_pss_mb": round(sum(w["pss_mb"] for w in workers) + memory(proc.pid)["pss_mb"], 1),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(30)
+
+def main():
+    parser = argparse.ArgumentParser(description="mémoire par worker gunicorn, avec / sans préchargement")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200, help="requêtes /api/route pour chauffer les workers")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--timeout", type=float, default=600, help="délai max de démarrage (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="fichier JSON (défaut : benchmarks/results/prefork_<date>.json)")
+    args = parser.parse_args()
+
+    report = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "database": os.getenv("path_to_database"),
+        "workers": args.workers,
+        "modes": [run_mode(preload, args, args.seed) for preload in (False, True)],
+    }
+    print(f"{'mode':<12}{'1re réponse':>12}{'RSS/worker':>12}{'USS/worker':>12}{'PSS total':>12}")
+    for m in report["modes"]:
+        print(f"{'preload' if m['preload'] else 'sans':<12}{m['first_response_s']:>11.1f}s{m['worker_rss_mean_mb']:>10.1f}Mo"
+              f"{m['worker_uss_mean_mb']:>10.1f}Mo{m['total_pss_mb']:>10.1f}Mo")
+
+    output = args.output or os.path.join(HERE, "results", f"prefork_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print("résultats écrits dans", output)
+
+if __name__ == "__main__":
+    main()
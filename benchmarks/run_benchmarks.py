@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Suite de benchmarks sur des réseaux synthétiques (generate_network.py) de
+1k, 10k et 100k gares. Pour chaque taille, un processus neuf (base et caches
+propres) mesure :
+  chargement de la base, construction du graphe, dijkstra, recherche de gares
+  candidates, best_station_match, gazetteer, extraction NER et phrase_to_trip complet.
+Si les modèles NLP ne sont pas disponibles, les étapes NER sont marquées
+"skipped" et phrase_to_trip est mesuré à partir des noms bruts (sans NER).
+
+Les résultats sont écrits en JSON (benchmarks/results/ par défaut) pour suivre
+les régressions d'un commit à l'autre.
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --queries 200
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, os.pardir))
+sys.path.append(ROOT)
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+PHRASES = [
+    "je veux aller de {d} à {a}",
+    "un billet {d} {a} s'il vous plaît",
+    "comment aller à {a} depuis {d}",
+    "trajet de {d} vers {a}",
+]
+
+
+def summarize(samples):
+    a = np.asarray(samples, dtype="float64") * 1e3
+    return {
+        "n": len(a),
+        "mean_ms": round(float(a.mean()), 4),
+        "p50_ms": round(float(np.percentile(a, 50)), 4),
+        "p95_ms": round(float(np.percentile(a, 95)), 4),
+        "max_ms": round(float(a.max()), 4),
+    }
+
+def timed(fn, args_list):
+    samples, results = [], []
+    for args in args_list:
+        t0 = time.perf_counter()
+        results.append(fn(*args))
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples), results
+
+def typo(name, rng):
+    """Nom en minuscules avec une faute (lettre supprimee) pour les requetes floues."""
+    name = name.lower()
+    if len(name) < 6:
+        return name
+    k = rng.randrange(1, len(name) - 1)
+    return name[:k] + name[k + 1:]
+
+
+def reachable_pairs(graph, n, rng, max_hops=64):
+    """Couples (depart, arrivee) relies : marche aleatoire le long des arcs du graphe."""
+    indptr, indices = graph.indptr.tolist(), graph.indices.tolist()
+    starts = [i for i in range(len(graph.nodes)) if indptr[i + 1] > indptr[i]]
+    pairs = []
+    while starts and len(pairs) < n:
+        u = v = rng.choice(starts)
+        for _ in range(rng.randint(1, max_hops)):
+            a, b = indptr[v], indptr[v + 1]
+            if a == b:
+                break
+            v = indices[rng.randrange(a, b)]
+        if v != u:
+            pairs.append((graph.nodes[u], graph.nodes[v]))
+    return pairs
+
+
+def run_child(queries, seed):
+    rng = random.Random(seed)
+    result = {}
+
+    t0 = time.perf_counter()
+    from back import dataframe
+    result["load_database_s"] = round(time.perf_counter() - t0, 3)
+    t0 = time.perf_counter()
+    from back import path_finding
+    result["import_path_finding_s"] = round(time.perf_counter() - t0, 3)
+    t0 = time.perf_counter()
+    from back import stations, phrase_controller, extract_gares
+    result["import_stations_matcher_s"] = round(time.perf_counter() - t0, 3)
+
+    df = path_finding.df
+    result["rows"] = len(df)
+    result["stations"] = len(stations.registry)
+    result["edges"] = len(path_finding.graph.indices)
+
+    # construction du graphe sans cache : normalisation des heures, arcs OD, CSR
+    t0 = time.perf_counter()
+    work = df[["trip_id", "stop_sequence", path_finding.NODE_COL, "departure_time", "arrival_time"]].copy()
+    work["dep_s_norm"] = path_finding.normalize_times_per_trip(work, "departure_time")
+    work["arr_s_norm"] = path_finding.normalize_times_per_trip(work, "arrival_time")
+    best_edges = path_finding.best_edges_from(path_finding.build_edges(work))
+    path_finding.Graph.from_edges(best_edges, path_finding.node_coordinates(df))
+    result["graph_build_s"] = round(time.perf_counter() - t0, 3)
+
+    # couples relies, puis couples tires au hasard (souvent sans chemin : exploration complete)
+    nodes = path_finding.graph.nodes.tolist()
+    for key, pairs in (("dijkstra", reachable_pairs(path_finding.graph, queries, rng)),
+                       ("dijkstra_random_pairs", [tuple(rng.sample(nodes, 2)) for _ in range(queries)])):
+        settled = []
+        def dijkstra(s, t):
+            stats = {}
+            out = path_finding.dijkstra(s, t, stats=stats)
+            settled.append(stats.get("settled", 0))
+            return out
+        result[key], routes = timed(dijkstra, pairs)
+        result[key]["settled_mean"] = round(float(np.mean(settled)), 1)
+        result[key]["reachable"] = round(sum(path is not None for path, _ in routes) / len(routes), 3)
+
+    names = stations.registry.names.tolist()
+    picked = [rng.choice(names) for _ in range(queries)]
+    result["station_lookup"], found = timed(stations.registry.candidates, [(n.lower()[:5],) for n in picked])
+    result["station_lookup"]["candidates_mean"] = round(float(np.mean([len(f[1]) for f in found])), 1)
+
+    fuzzy = [(typo(n, rng), stations.registry.candidates(n.lower()[:4])[1]) for n in picked]
+    result["best_station_match"], _ = timed(phrase_controller.best_station_match, fuzzy)
+
+    phrases = [(rng.choice(PHRASES).format(d=d, a=a),) for d, a in zip(picked, reversed(picked))]
+    result["gazetteer"], found = timed(phrase_controller.gazetteer.extract, phrases)
+    result["gazetteer"]["hit_rate"] = round(sum(f is not None for f in found) / len(found), 3)
+    try:
+        extract_gares.load_models()
+    except Exception as e:  # spaCy / modele NER absents dans cet environnement
+        result["ner"] = {"skipped": f"{type(e).__name__}: {e}"}
+    if "ner" not in result:
+        result["ner"], _ = timed(extract_gares.extract_stations, phrases)
+        t0 = time.perf_counter()
+        extract_gares.extract_stations_batch([p for p, in phrases])
+        result["ner"]["batch_per_phrase_ms"] = round((time.perf_counter() - t0) / len(phrases) * 1e3, 4)
+
+    def clear_caches():
+        for cache in (phrase_controller.phrase_cache, phrase_controller.candidates_cache, phrase_controller.route_cache):
+            cache.clear()
+    def phrase_to_trip(phrase):
+        clear_caches()
+        return phrase_controller.phrase_to_trip(phrase)
+    def from_raw_names(d, a):
+        clear_caches()
+        trip_info = phrase_controller.trip_info_from_stations({"raw_input_depart": d, "raw_input_arrivee": a})
+        return trip_info if type(trip_info) == str else phrase_controller.route_trip_info(trip_info)
+
+    if "skipped" in result["ner"]:
+        key = "phrase_to_trip_without_ner"
+        # noms bruts tels que sortis du NER : debut du nom, en minuscules
+        raw = [(d.lower()[:6], a.lower()[:6]) for d, a in zip(picked, reversed(picked))]
+        result[key], trips = timed(from_raw_names, raw)
+        result[key]["routed"] = round(sum(type(t) != str for t in trips) / len(trips), 3)
+    else:
+        key = "phrase_to_trip"
+        result[key], _ = timed(phrase_to_trip, phrases)
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT).stdout.strip()
+    except OSError:
+        return None
+
+def dataset(size, data_dir, seed):
+    path = os.path.join(data_dir, f"network_{size}_s{seed}.csv")
+    if not os.path.exists(path):
+        sys.path.append(HERE)
+        import generate_network
+        print(f"génération de {path}")
+        df = generate_network.generate(size, seed=seed)
+        os.makedirs(data_dir, exist_ok=True)
+        df.to_csv(path, sep=";", index=False, encoding="utf-8")
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmarks sur réseaux synthétiques, résultats en JSON")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="nombre de gares par réseau")
+    parser.add_argument("--queries", type=int, default=200, help="requêtes par benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(HERE, "data"))
+    parser.add_argument("-o", "--output", help="fichier JSON (défaut : benchmarks/results/<date>_<commit>.json)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):  # les print des modules ne polluent pas le JSON
+            result = run_child(args.queries, args.seed)
+        out.write(json.dumps(result) + "\n")
+        return
+
+    commit = git_commit()
+    report = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "queries": args.queries,
+        "results": {},
+    }
+    for size in args.sizes:
+        path = dataset(size, args.data_dir, args.seed)
+        with tempfile.TemporaryDirectory() as cache:
+            env = {**os.environ, "path_to_database": path, "path_to_cache": cache}
+            proc = subprocess.run(
+                [sys.executable, __file__, "--child", "--queries", str(args.queries), "--seed", str(args.seed)],
+                capture_output=True, text=True, cwd=ROOT, env=env,
+            )
+        if proc.returncode:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit(f"échec du benchmark pour {size} gares")
+        r = report["results"][str(size)] = json.loads(proc.stdout.strip().splitlines()[-1])
+        e2e = r.get("phrase_to_trip") or r["phrase_to_trip_without_ner"]
+        print(f"{size:>7} gares : base {r['load_database_s']:.2f}s, graphe {r['graph_build_s']:.2f}s, "
+              f"dijkstra p50 {r['dijkstra']['p50_ms']:.2f}ms, candidats p50 {r['station_lookup']['p50_ms']:.3f}ms, "
+              f"match p50 {r['best_station_match']['p50_ms']:.3f}ms, e2e p50 {e2e['p50_ms']:.2f}ms"
+              + (" (sans NER)" if "skipped" in r["ner"] else ""))
+
+    output = args.output or os.path.join(HERE, "results", f"{time.strftime('%Y%m%d-%H%M%S')}_{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print("résultats écrits dans", output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Service multi-workers :
+
+    gunicorn -c gunicorn.conf.py
+
+main.py est importé une fois dans le maître (preload_app) : base, graphe, gares et
+modèles NLP sont partagés entre workers (cf. back/prefork.py).
+gunicorn_workers, gunicorn_bind, gunicorn_preload=0 (chaque worker charge tout) dans l'environnement.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+wsgi_app = "main:server"
+bind = os.getenv("gunicorn_bind", "0.0.0.0:8090")
+workers = int(os.getenv("gunicorn_workers") or 4)
+threads = int(os.getenv("gunicorn_threads") or 4)  # requetes concurrentes par worker (callbacks Dash, API)
+preload_app = os.getenv("gunicorn_preload", "1") == "1"
+timeout = 120
+
+if preload_app:
+    os.environ["prefork"] = "1"  # lu par back.prefork a l'import de main.py (dans le maitre)
+
+
+def post_fork(server, worker):
+    from back import prefork
+    prefork.post_fork(server.cfg.workers)
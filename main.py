@@ -4,190 +4,336 @@ from dash import html ,clientside_callback
 import datetime as dt
 from flask import request, jsonify
 import base64
-from dash import callback, Input, Output, State,dash_table
+from dash import callback, Input, Output, State, Patch, dash_table
 from flask import Flask, Response, request
 from dash.exceptions import PreventUpdate
 import os
+import threading
 import plotly.graph_objects as go
 import numpy as np
-from back import dataframe, stations 
-from back.path_finding import dijkstra
+from back import dataframe, snapshot, stations 
 from back import extract_gares , phrase_controller
+from back.api import register_api
+from back import hot_reload
+from back import background
+from back import prefork
+from back import metrics
 
 
-app = dash.Dash(__name__,title=f'Travel Recorder',use_pages=False,suppress_callback_exceptions=True)
+# callbacks lourds (phrases) dans des processus de job ; resultats identiques reutilises
+# tant que la base, le modele NER et l'etat de chargement des modeles ne changent pas
+background_manager = background.manager(cache_by=[
+    lambda: stations.registry.version, extract_gares.model_version, extract_gares.models_ready,
+    extract_gares.models_error,
+])
+app = dash.Dash(__name__,title=f'Travel Recorder',use_pages=False,suppress_callback_exceptions=True,
+                background_callback_manager=background_manager)
 server = app.server
+register_api(server)  # API JSON : /api/route, /api/phrase, /api/phrases
+metrics.register_metrics(server)  # /metrics au format Prometheus
 
+if not prefork.ENABLED:  # sous gunicorn : cf. prefork.preload() en fin de module
+    # chargement des modeles NLP en tache de fond : la carte et les menus sont servis tout de suite
+    threading.Thread(target=extract_gares.load_models, name="load-models", daemon=True).start()
+    # rechargement de la base quand le fichier change (reload_interval_s dans le .env)
+    hot_reload.start_watcher()
 
-all_stations = stations.get_all_stations()
-names_list = [*set(all_stations["names"])]
-#---create map---
-fig = go.Figure()
 
-fig.add_trace(go.Scattermap(
-    lat=all_stations['lats'],
-    lon=all_stations['lons'],
-    mode="markers",
-    hoverinfo="text",
-    text=all_stations["names"],
-))
+STATION_TRACE = 0  # gares visibles dans la vue courante
+ISO_TRACE = 1  # gares accessibles depuis une gare (isochrone), colorees par duree
+ALT_TRACES = [2 + i for i in range(phrase_controller.MAX_ROUTES - 1)]  # itineraires alternatifs, sous le trajet
+ROUTE_TRACE = ALT_TRACES[-1] + 1 if ALT_TRACES else ISO_TRACE + 1  # index de la trace du trajet dans la figure de base
+ROUTE_COLOR = "#eb6262"
+ALT_COLOR = "#7f8fa6"
+MAP_WIDTH, MAP_HEIGHT, MAP_ZOOM = 2000, 1500, 5
+MAX_MARKERS = 3000  # au-dela, un marqueur par zone (carte dezoomee)
+MAX_ISO_MARKERS = 20000  # gares max de la couche isochrone (echantillon reparti sur les durees au-dela)
+ISO_MAX_HOURS = 12
 
-fig.update_layout(
-    map_style="open-street-map",
-    width=2000,
-    height=1500,
-)
+def viewport(center, zoom, margin=1.2):
+    """Rectangle (sud, ouest, nord, est) approximativement visible pour un centre et un zoom."""
+    deg_per_px = 360 / (512 * 2 ** zoom)  # tuiles maplibre de 512 px
+    half_lon = MAP_WIDTH / 2 * deg_per_px * margin
+    half_lat = MAP_HEIGHT / 2 * deg_per_px * np.cos(np.radians(center["lat"])) * margin
+    return center["lat"] - half_lat, center["lon"] - half_lon, center["lat"] + half_lat, center["lon"] + half_lon
 
-fig.update_layout(
-    map_center={"lat": np.array(all_stations["lats"]).mean(), "lon": np.array(all_stations["lons"]).mean()},
-    map_zoom=5
-)
+def station_layer(bbox):
+    in_view = stations.stations_in_bbox(*bbox, max_points=MAX_MARKERS)
+    return {
+        "lat": [s["lat"] for s in in_view],
+        "lon": [s["lon"] for s in in_view],
+        "text": [s["name"] for s in in_view],
+    }
+
+def map_center(all_stations):
+    return {"lat": float(np.mean(all_stations["lats"])), "lon": float(np.mean(all_stations["lons"]))}
+
+#---create map--- (construite une fois par version de la base, les trajets et la vue sont envoyés en Patch)
+def build_base_figure(center):
+    fig = go.Figure()
 
-app.layout=html.Div(className='wrapper-main',children=[
-    dcc.Store(id="station_data", data = all_stations),
+    layer = station_layer(viewport(center, MAP_ZOOM))
+    fig.add_trace(go.Scattermap(
+        lat=layer['lat'],
+        lon=layer['lon'],
+        mode="markers",
+        hoverinfo="text",
+        text=layer["text"],
+        name="gares",
+    ))
+    fig.add_trace(go.Scattermap(
+        lat=[],
+        lon=[],
+        mode="markers",
+        hoverinfo="text",
+        text=[],
+        marker=dict(
+            size=9,
+            color=[],
+            colorscale="Viridis",
+            cmin=0,
+            cmax=ISO_MAX_HOURS * 60,
+            colorbar=dict(title="minutes"),
+            showscale=False,
+        ),
+        name="isochrone",
+    ))
+    for i in ALT_TRACES:
+        fig.add_trace(go.Scattermap(
+            lat=[],
+            lon=[],
+            mode="markers+lines",
+            hoverinfo="text",
+            text=[],
+            marker_color=ALT_COLOR,
+            line_color=ALT_COLOR,
+            opacity=0.7,
+            name=f"alternative {i}",
+        ))
+    # trace du trajet, vide tant qu'aucune requête n'a été faite
+    fig.add_trace(go.Scattermap(
+        lat=[],
+        lon=[],
+        mode="markers+lines",
+        hoverinfo="text",
+        text=[],
+        marker_color=ROUTE_COLOR,
+        line_color=ROUTE_COLOR,
+        name="trajet",
+    ))
+
+    fig.update_layout(
+        map_style="open-street-map",
+        width=MAP_WIDTH,
+        height=MAP_HEIGHT,
+        showlegend=False,
+        uirevision="carte",  # garde la vue de l'utilisateur quand les traces sont mises a jour
+    )
+
+    fig.update_layout(
+        map_center=center,
+        map_zoom=MAP_ZOOM
+    )
+    return fig
+
+_base_figure = (None, None)  # (version de la base, figure)
+
+def base_figure():
+    """Figure de base de la base courante (reconstruite après un rechargement)."""
+    global _base_figure
+    with snapshot.pinned() as current:
+        version, fig = _base_figure
+        if version != current.version:
+            fig = build_base_figure(map_center(stations.get_all_stations()))
+            _base_figure = (current.version, fig)
+    return fig
+
+base_figure()  # construite au demarrage (avant le fork sous gunicorn)
+
+def serve_layout():
+    # appele a chaque chargement de page : gares et centre de la carte suivent la base rechargee
+    # names_list = [*set(stations.get_all_stations()["names"])]
+    return html.Div(className='wrapper-main',children=[
     # dcc.Dropdown(id="depart",options=names_list,placeholder="Départ", multi=False),
     # dcc.Dropdown(id="arrivee",options=names_list,placeholder="Arrivée",  multi=False),
     dcc.Input(id="phrase",placeholder="Entrez votre demmande", debounce=True),
+    html.Div(className="isochrone", children=[
+        dcc.Input(id="iso_depart", placeholder="Gares accessibles depuis...", debounce=True),
+        dcc.Slider(id="iso_hours", min=0.5, max=ISO_MAX_HOURS, step=0.5, value=3,
+                   marks={h: f"{h} h" for h in (1, 3, 6, 9, 12)}),
+    ]),
+    html.Div(id="progress", style={"display": "none"}),
     html.Div(id="outputs"),
     html.Div(className="map", children=[
-        dcc.Graph(id='map_graph',figure=fig,config={"displaylogo": False}),
+        dcc.Graph(id='map_graph',figure=base_figure(),config={"displaylogo": False}),
     ])
     
 ])
 
+app.layout = serve_layout
+
+
+def duration(total_s):
+    #convertir le temps en heures ou minutes 
+    if total_s < 3600:
+        return f"{round(total_s/60)} minutes"
+    return f"{round(total_s/3600, 2)} heures"
+
+def format_duration(total_s, alternatives=()):
+    text = f"Temps de trajet = {duration(total_s)}"
+    if alternatives:
+        text += " | Alternatives : " + ", ".join(duration(alt['total_s']) for alt in alternatives)
+    return text
+
+def route_patch(path, alternatives=()):
+    """Mise à jour partielle de la carte : seules les traces des trajets et le centre sont envoyés."""
+    names, highlight_lat, highlight_lon = stations.registry.locate(path)
+    patch = Patch()
+    patch["data"][ROUTE_TRACE]["lat"] = highlight_lat
+    patch["data"][ROUTE_TRACE]["lon"] = highlight_lon
+    patch["data"][ROUTE_TRACE]["text"] = names
+    for i, trace in enumerate(ALT_TRACES):
+        alt_names, alt_lat, alt_lon = stations.registry.locate(alternatives[i]['path']) if i < len(alternatives) else ([], [], [])
+        patch["data"][trace]["lat"] = alt_lat
+        patch["data"][trace]["lon"] = alt_lon
+        patch["data"][trace]["text"] = alt_names
+    patch["layout"]["map"]["center"] = {"lat": float(np.mean(highlight_lat)), "lon": float(np.mean(highlight_lon))}
+    patch["layout"]["uirevision"] = f"{path[0]}-{path[-1]}"  # nouveau trajet : la carte se recentre
+    return patch
+
+def show_route(path, total_s, alternatives=()):
+    if path == None:
+        return dash.no_update, "Gare non trouvée"
+    with metrics.span("figure"):
+        patch = route_patch(path, alternatives)
+    return patch, format_duration(total_s, alternatives)
 
 
+#------------------- gares visibles CALLBACK ---------------------
+@callback(
+    Output("map_graph", "figure", allow_duplicate=True),
+    Input("map_graph", "relayoutData"),
+    prevent_initial_call=True,
+)
+def update_viewport(relayout):
+    # deplacement / zoom de la carte : seules les gares de la vue sont envoyees
+    if not relayout:
+        raise PreventUpdate
+    derived = relayout.get("map._derived")
+    if derived and derived.get("coordinates"):
+        lons = [c[0] for c in derived["coordinates"]]
+        lats = [c[1] for c in derived["coordinates"]]
+        bbox = (min(lats), min(lons), max(lats), max(lons))
+    elif "map.center" in relayout and "map.zoom" in relayout:
+        bbox = viewport(relayout["map.center"], relayout["map.zoom"])
+    else:
+        raise PreventUpdate
+
+    with metrics.span("viewport"):
+        layer = station_layer(bbox)
+    patch = Patch()
+    patch["data"][STATION_TRACE]["lat"] = layer["lat"]
+    patch["data"][STATION_TRACE]["lon"] = layer["lon"]
+    patch["data"][STATION_TRACE]["text"] = layer["text"]
+    return patch
+
 #------------------- path finding by dropdonws CALLBACK ---------------------
 @callback(
-    Output("station_data", "data"),
     Output("map_graph", "figure"),
     Output('outputs',"children"),
     Input("depart", "value"),
     Input("arrivee", "value"),
-    State("station_data","data"),
-    State("map_graph", "figure"),
     prevent_initial_call=True,
 )
-def find_path_by_name(depart, arrivee, store,fig): 
+def find_path_by_name(depart, arrivee): 
     if depart == None or arrivee == None:
         raise PreventUpdate
     
-    id_depart = store["stations"][depart]["id"]
-    id_arrivee = store["stations"][arrivee]["id"]
-    #trouve le chemin le plus court
-    path, total_s = dijkstra(id_depart, id_arrivee)
-
-    highlight_lat = []
-    highlight_lon = []
-    names = []
-    colors = []
-    for item in path:
-        name_ = stations.get_station_name_by_id(item)
-        highlight_lat.append(store["stations"][name_]["lat"])
-        highlight_lon.append(store["stations"][name_]["lon"])
-        names.append(name_)
-        colors.append("#eb6262")
-    
-    
-    #afficher le bins 
-    fig = go.Figure()
-
-    fig.add_trace(go.Scattermap(
-        lat=highlight_lat,
-        lon=highlight_lon,
-        mode="markers+lines",
-        hoverinfo="text",
-        text=names,
-        marker_color = colors
-    ))
-
-    fig.update_layout(
-        map_style="open-street-map",
-        width=2000,
-        height=1500,
-    )
-
-    fig.update_layout(
-        map_center={"lat": np.array(highlight_lat).mean(), "lon": np.array(highlight_lon).mean()},
-        map_zoom=5
-    )
-
-    #convertir le temps en heures ou minutes 
-    if total_s < 3600:
-        output_string = f"Temps de trajet = {round(total_s/60)} minutes"
-    else:
-        output_string = f"Temps de trajet = {round(total_s/3600, 2)} heures"
-
-
-    return store, fig, output_string
+    with snapshot.pinned(), metrics.span("callback_dropdowns", profile=True):
+        id_depart = stations.registry.id_by_name[depart]
+        id_arrivee = stations.registry.id_by_name[arrivee]
+        #trouve le chemin le plus court et les alternatives
+        routes = phrase_controller.cached_k_shortest_paths(id_depart, id_arrivee)
+        if not routes:
+            return show_route(None, None)
+        (path, total_s), alternatives = routes[0], [{'path':p, 'total_s':t} for p, t in routes[1:]]
+        return show_route(path, total_s, alternatives)
 
 #------------------- path finding by phrase CALLBACK ---------------------
+# background callback : la phrase est traitee dans un processus de job, le serveur reste
+# disponible pour la carte ; une nouvelle saisie tue le job precedent
 @callback(
-    Output("station_data", "data",allow_duplicate=True),
     Output("map_graph", "figure",allow_duplicate=True),
     Output('outputs',"children",allow_duplicate=True),
-    State("map_graph", "figure"),
     Input("phrase", "value"),
-    State("station_data","data"),
+    background=True,
+    progress=[Output("progress", "children")],
+    running=[(Output("progress", "style"), {"display": "block"}, {"display": "none"})],
     prevent_initial_call=True,
 )
-def get_phrase(fig,phrase,store):
+def get_phrase(set_progress, phrase):
     if phrase == None :
-        return dash.no_update, dash.no_update, "Veuillez entrer une phrase"
-    
-    trip_data = phrase_controller.phrase_to_trip(phrase)
-    if type(trip_data) == str:
-        return dash.no_update, dash.no_update, trip_data
+        return dash.no_update, "Veuillez entrer une phrase"
+    # les phrases simples sont resolues par le gazetteer, sans attendre les modeles
+    if not extract_gares.models_ready() and phrase_controller.gazetteer.extract(phrase) is None:
+        if extract_gares.models_error() is not None:
+            return dash.no_update, f"Modèles NLP indisponibles ({extract_gares.models_error()}) : seules les phrases simples (« de X à Y ») sont comprises"
+        return dash.no_update, "Chargement des modèles en cours, réessayez dans quelques secondes"
 
-    path = trip_data['best_trip']['path']
-    total_s = trip_data['best_trip']['total_s']
-    print(path)
-    if path == None:
-        return dash.no_update, dash.no_update, "Gare non trouvée"
-    highlight_lat = []
-    highlight_lon = []
-    names = []
-    colors = []
-    for item in path:
-        name_ = stations.get_station_name_by_id(item)
-        highlight_lat.append(store["stations"][name_]["lat"])
-        highlight_lon.append(store["stations"][name_]["lon"])
-        names.append(name_)
-        colors.append("#eb6262")
-    
-    
-    #afficher le bins 
-    fig = go.Figure()
+    def compute():
+        set_progress("En attente d'un worker...")
+        with background.worker_slot():
+            return phrase_controller.phrase_to_trip(phrase, progress=set_progress)
 
-    fig.add_trace(go.Scattermap(
-        lat=highlight_lat,
-        lon=highlight_lon,
-        mode="markers+lines",
-        hoverinfo="text",
-        text=names,
-        marker_color = colors
-    ))
+    # une seule execution pour des phrases identiques en cours (autres utilisateurs)
+    key = (stations.registry.version, extract_gares.model_version(), " ".join(str(phrase).lower().split()))
+    trip_data = background.deduplicated(key, compute, on_wait=lambda: set_progress("Même demande en cours..."))
+    if type(trip_data) == str:
+        return dash.no_update, trip_data
 
-    fig.update_layout(
-        map_style="open-street-map",
-        width=2000,
-        height=1500,
-    )
+    best = trip_data['best_trip']
+    return show_route(best['path'], best['total_s'], trip_data['alternative_routes'])
 
-    fig.update_layout(
-        map_center={"lat": np.array(highlight_lat).mean(), "lon": np.array(highlight_lon).mean()},
-        map_zoom=5
-    )
+#------------------- isochrone CALLBACK ---------------------
+def isochrone_patch(ids, durations):
+    """Couche des gares accessibles (couleur = durée) ; les traces de trajet ne sont pas touchées."""
+    if len(ids) > MAX_ISO_MARKERS:
+        keep = np.linspace(0, len(ids) - 1, MAX_ISO_MARKERS).astype(int)
+        ids, durations = ids[keep], durations[keep]
+    known = [i for i, id_ in enumerate(ids.tolist()) if id_ in stations.registry.index_by_id]
+    names, lats, lons = stations.registry.locate(ids[known].tolist())
+    minutes = (durations[known] / 60).round().astype(int).tolist()
+    patch = Patch()
+    patch["data"][ISO_TRACE]["lat"] = lats
+    patch["data"][ISO_TRACE]["lon"] = lons
+    patch["data"][ISO_TRACE]["text"] = [f"{n} ({m} min)" for n, m in zip(names, minutes)]
+    patch["data"][ISO_TRACE]["marker"]["color"] = minutes
+    patch["data"][ISO_TRACE]["marker"]["showscale"] = bool(minutes)
+    return patch
 
-    #convertir le temps en heures ou minutes 
-    if total_s < 3600:
-        output_string = f"Temps de trajet = {round(total_s/60)} minutes"
-    else:
-        output_string = f"Temps de trajet = {round(total_s/3600, 2)} heures"
+@callback(
+    Output("map_graph", "figure",allow_duplicate=True),
+    Output('outputs',"children",allow_duplicate=True),
+    Input("iso_depart", "value"),
+    Input("iso_hours", "value"),
+    prevent_initial_call=True,
+)
+def show_isochrone(depart, hours):
+    if not depart or not hours:
+        raise PreventUpdate
 
+    with snapshot.pinned(), metrics.span("callback_isochrone", profile=True):
+        ranked = phrase_controller.ranked_candidates(depart)
+        if ranked is None:
+            return dash.no_update, "Gare non trouvée"
+        names, _, ids = ranked
+        reached, durations = phrase_controller.cached_reachable(ids[0], hours * 3600)
+        patch = isochrone_patch(reached, durations)
+    return patch, f"{len(reached)} gares accessibles depuis {names[0]} en moins de {hours} h"
 
-    return store, fig, output_string
+if prefork.ENABLED:
+    # gunicorn (gunicorn.conf.py) : modeles et graphe charges avant le fork, partages entre workers
+    prefork.preload()
 
 if __name__ == "__main__":
     app.run(debug=True, port = 8090)
-